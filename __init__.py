@@ -41,17 +41,42 @@ bl_info = {
 if "bpy" in locals():
     import importlib
 
-    from . import coordinates, convolution, data_links, operator, props, sampling, ui
+    from . import averaging, bake, beam, calibration, catalog, coordinates, convolution, coverage, data_links, dft, display, export, gridding, grid_overlay, mosaic, noise, operator, props, redundancy, sampling, shared_buffers, ui, visibility_store, weighting, workers, wstacking
     importlib.reload(coordinates)
+    importlib.reload(grid_overlay)
+    importlib.reload(workers)
+    importlib.reload(shared_buffers)
+    importlib.reload(visibility_store)
+    importlib.reload(weighting)
+    importlib.reload(redundancy)
+    importlib.reload(averaging)
+    importlib.reload(calibration)
+    importlib.reload(catalog)
+    importlib.reload(gridding)
+    importlib.reload(noise)
+    importlib.reload(dft)
+    importlib.reload(export)
+    importlib.reload(wstacking)
+    importlib.reload(beam)
+    importlib.reload(mosaic)
     importlib.reload(convolution)
+    importlib.reload(coverage)
+    importlib.reload(display)
     importlib.reload(props)
     importlib.reload(operator)
     importlib.reload(sampling)
+    importlib.reload(bake)
     importlib.reload(data_links)
     importlib.reload(ui)
 
-import bpy
-from . import operator, props, ui
+# Worker processes import compute modules of this package outside of Blender
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+if bpy is not None:
+    from . import display, export, operator, props, shared_buffers, ui, workers
 
 
 def register():
@@ -64,6 +89,10 @@ def unregister():
     operator.unregister()
     props.unregister()
     ui.unregister()
+    workers.shutdown()
+    export.shutdown()
+    shared_buffers.shutdown()
+    display.shutdown()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,151 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Baseline-dependent time and frequency averaging of visibility samples.
+# Short baselines move slowly through the uv plane, so many consecutive samples can be merged
+# while the uv smearing stays below a tolerance. Long baselines keep their full resolution.
+
+import numpy as np
+from .constants import c
+
+# Earth rotation rate relative to the fixed stars in radians per hour
+earth_rotation_rate = 2.0 * np.pi * (366.24/365.24) / 24.0
+
+"""
+Number of time steps and channels that can be averaged for each baseline.
+The uv track of a baseline moves at most |B| * omega per unit time, and the radial uv extent over a band of width df
+is |B| * df / c, both in wavelengths. Windows are chosen so that each stays below the tolerance in wavelengths.
+Returns integer arrays of time and channel window lengths, at least 1.
+"""
+def averaging_windows(baselines, max_frequency, time_step, channel_width, tolerance):
+    length = np.linalg.norm(baselines, axis=1)
+    time_smearing = length * max_frequency / c * earth_rotation_rate * time_step
+    freq_smearing = length * channel_width / c
+    with np.errstate(divide='ignore'):
+        time_window = np.floor(tolerance / time_smearing)
+        freq_window = np.floor(tolerance / freq_smearing)
+    time_window = np.clip(np.nan_to_num(time_window, posinf=1 << 30), 1, 1 << 30).astype(np.int64)
+    freq_window = np.clip(np.nan_to_num(freq_window, posinf=1 << 30), 1, 1 << 30).astype(np.int64)
+    return time_window, freq_window
+
+"""
+Streaming average of samples on the (time, baseline, channel) lattice, added in consecutive time blocks.
+Samples of a baseline are merged within windows of time_window x freq_window steps.
+Windows that extend past the end of a block are carried over as partial sums and completed by the next block,
+so averaging windows are not split at block boundaries.
+The averaged uvw is expressed in meters relative to the first channel of its window,
+so converting with the frequency of the stored channel gives the correct mean position in wavelengths.
+"""
+class SampleAverager:
+    def __init__(self, frequencies, time_window, freq_window):
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.time_window = time_window
+        self.freq_window = freq_window
+        # Partial sums of incomplete windows: baseline, time window, channel window, value sums, sample count
+        self._carry = None
+
+    """
+    Add a block of samples and return store columns of all windows completed by it, or None.
+    uvw has shape (T, M, 3) in meters, times (T,) and time_index (T,) the global step index of each time.
+    Blocks must be consecutive in time.
+    """
+    def add(self, uvw, times, time_index, vis=None):
+        num_times, num_baselines = uvw.shape[:2]
+        frequencies = self.frequencies
+        time_window = self.time_window
+        freq_window = self.freq_window
+        num_channels = len(frequencies)
+
+        t, b, ch = np.meshgrid(np.arange(num_times), np.arange(num_baselines), np.arange(num_channels), indexing='ij')
+        t, b, ch = t.ravel(), b.ravel(), ch.ravel()
+        # Dense group keys relative to the first window of each baseline in this block, avoids sorting
+        first_window = time_index[0] // time_window
+        tw = time_index[t] // time_window[b] - first_window[b]
+        fw = ch // freq_window[b]
+
+        scale = frequencies[ch] / c
+        values = [uvw[t, b, k] * scale for k in range(3)] + [times[t]]
+        if vis is not None:
+            v = vis[t, b, ch]
+            values += [v.real, v.imag]
+        values = np.stack(values)
+        count = np.ones(len(t))
+
+        if self._carry is not None:
+            # Carried windows contain the first step of this block
+            carry_baseline, carry_tw, carry_fw, carry_sums, carry_count = self._carry
+            b = np.concatenate((b, carry_baseline))
+            tw = np.concatenate((tw, carry_tw - first_window[carry_baseline]))
+            fw = np.concatenate((fw, carry_fw))
+            values = np.concatenate((values, carry_sums), axis=1)
+            count = np.concatenate((count, carry_count))
+
+        num_tw = int(np.max(tw)) + 1
+        num_fw = int(np.max(fw)) + 1
+        keys = (b * num_tw + tw) * num_fw + fw
+        group_count = np.bincount(keys, weights=count)
+        groups = np.flatnonzero(group_count)
+        lookup = np.zeros(len(group_count), dtype=np.int64)
+        lookup[groups] = np.arange(len(groups))
+        inverse = lookup[keys]
+
+        group_baseline = groups // (num_tw * num_fw)
+        group_tw = (groups // num_fw) % num_tw + first_window[group_baseline]
+        group_fw = groups % num_fw
+        sums = np.stack([np.bincount(inverse, weights=x, minlength=len(groups)) for x in values])
+        group_count = group_count[groups]
+
+        complete = (group_tw + 1) * time_window[group_baseline] <= time_index[-1] + 1
+        incomplete = ~complete
+        self._carry = (group_baseline[incomplete], group_tw[incomplete], group_fw[incomplete],
+                       sums[:, incomplete], group_count[incomplete])
+        return self._columns(group_baseline[complete], group_fw[complete], sums[:, complete], group_count[complete])
+
+    """
+    Return store columns of the remaining incomplete windows at the end of the observation, or None.
+    """
+    def finish(self):
+        if self._carry is None:
+            return None
+        baseline, _, fw, sums, count = self._carry
+        self._carry = None
+        return self._columns(baseline, fw, sums, count)
+
+    def _columns(self, baseline, fw, sums, count):
+        if len(count) == 0:
+            return None
+        mean = sums / count
+        channel = fw * self.freq_window[baseline]
+        to_meters = c / self.frequencies[channel]
+        return {
+            "uvw": (mean[:3] * to_meters).T,
+            "time": mean[3],
+            "baseline": baseline.astype(np.int32),
+            "channel": channel.astype(np.int16),
+            "weight": count,
+            "vis": mean[4] + 1j * mean[5] if len(mean) > 4 else 1.0,
+        }
@@ -0,0 +1,177 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Baking of sampling and point spread images for a frame range.
+# Frames are baked in the worker pool, see workers.
+
+import json
+import os
+import numpy as np
+from .gridding import grid_samples, rotate_baselines, sampling_to_images
+from .weighting import weight_grid
+
+header_filename = "header.json"
+image_names = ("sampling", "pointspread")
+
+# Open caches by directory, so memory maps are reused during playback
+_open_caches = {}
+
+"""
+On-disk cache of baked per-frame images.
+Images are stored as float16 greyscale values in one .npy file per image type, indexed by frame.
+"""
+class BakeCache:
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+        self.frame_start = 0
+        self.frame_end = -1
+        self.width = 0
+        self.height = 0
+        self._maps = None
+        try:
+            with open(os.path.join(dirpath, header_filename), 'r') as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.frame_start = header["frame_start"]
+        self.frame_end = header["frame_end"]
+        self.width = header["width"]
+        self.height = header["height"]
+
+    @property
+    def num_frames(self):
+        return max(self.frame_end - self.frame_start + 1, 0)
+
+    def _image_path(self, name):
+        return os.path.join(self.dirpath, name + ".npy")
+
+    """
+    Allocate cache files for a new bake, existing data is discarded.
+    """
+    def create(self, frame_start, frame_end, width, height):
+        os.makedirs(self.dirpath, exist_ok=True)
+        self.frame_start = frame_start
+        self.frame_end = frame_end
+        self.width = width
+        self.height = height
+        self._maps = None
+        for name in image_names:
+            np.lib.format.open_memmap(self._image_path(name), mode='w+', dtype=np.float16,
+                                      shape=(self.num_frames, height, width))
+        with open(os.path.join(self.dirpath, header_filename), 'w') as f:
+            json.dump({"frame_start": frame_start, "frame_end": frame_end, "width": width, "height": height}, f)
+
+    def open_maps(self, mode='r'):
+        return {name: np.load(self._image_path(name), mmap_mode=mode) for name in image_names}
+
+    """
+    Baked greyscale pixels of an image for a frame, None if the frame is not baked.
+    """
+    def frame_pixels(self, name, frame):
+        if not (self.frame_start <= frame <= self.frame_end):
+            return None
+        if self._maps is None:
+            try:
+                self._maps = self.open_maps()
+            except (OSError, ValueError):
+                return None
+        return self._maps[name][frame - self.frame_start]
+
+
+"""
+Get the bake cache for a directory, reload discards a previously opened cache.
+"""
+def get_cache(dirpath, reload=False):
+    cache = None if reload else _open_caches.get(dirpath)
+    if cache is None:
+        cache = BakeCache(dirpath)
+        _open_caches[dirpath] = cache
+    return cache
+
+
+def _grid_frames(grid, baselines, rotations, scale, weights=1.0):
+    for rotation in rotations:
+        uv = rotate_baselines(baselines, rotation[None])[0]
+        grid_samples(grid, uv[:, 0], uv[:, 1], weights, scale)
+
+"""
+Worker: natural sampling grid of all frames in a block.
+"""
+def grid_block(baselines, rotations, width, height, scale, weights=1.0):
+    grid = np.zeros((height, width), dtype=np.complex128)
+    _grid_frames(grid, baselines, rotations, scale, weights)
+    return grid.real
+
+"""
+Worker: bake cumulative sampling and point spread images for a block of frames.
+offset is the accumulated natural sampling grid of all frames before the block.
+"""
+def bake_block(dirpath, first, baselines, rotations, offset, scale, weighting_mode, robust, taper, weights=1.0):
+    maps = BakeCache(dirpath).open_maps(mode='r+')
+    grid = offset.astype(np.complex128)
+    for k, rotation in enumerate(rotations):
+        _grid_frames(grid, baselines, rotation[None], scale, weights)
+        weighted = weight_grid(grid.real, weighting_mode, robust, taper)
+        sampling, pointspread = sampling_to_images(weighted.astype(np.complex128))
+        maps["sampling"][first + k] = sampling
+        maps["pointspread"][first + k] = np.clip(np.real(pointspread), 0.0, 1.0)
+    for m in maps.values():
+        m.flush()
+
+"""
+Bake cumulative observation images for a sequence of per-frame target rotations.
+Frames are split into contiguous blocks, one per worker: first the sampling grid of each block is computed in parallel,
+then each block bakes its frames starting from the accumulated grid of all previous blocks.
+weights are the natural weights of baselines, e.g. the multiplicity of redundant baselines.
+progress is an optional callable receiving the fraction of finished blocks.
+"""
+def bake_observation(cache, baselines, rotations, frame_start, width, height, executor, num_blocks,
+                     weighting_mode='NATURAL', robust=0.0, taper=0.0, weights=1.0, progress=None):
+    num_frames = len(rotations)
+    cache.create(frame_start, frame_start + num_frames - 1, width, height)
+    max_length = np.max(np.linalg.norm(baselines, axis=1)) if len(baselines) > 0 else 0.0
+    if num_frames == 0 or max_length <= 0.0:
+        return False
+    scale = (min(width, height) / 4) / max_length
+    taper *= min(width, height) / 4
+
+    bounds = np.linspace(0, num_frames, min(num_blocks, num_frames) + 1).astype(int)
+    blocks = list(zip(bounds[:-1], bounds[1:]))
+
+    totals = [executor.submit(grid_block, baselines, rotations[a:b], width, height, scale, weights) for a, b in blocks]
+    offset = np.zeros((height, width))
+    futures = []
+    for (a, b), total in zip(blocks, totals):
+        futures.append(executor.submit(bake_block, cache.dirpath, a, baselines, rotations[a:b], offset,
+                                       scale, weighting_mode, robust, taper, weights))
+        offset = offset + total.result()
+
+    for i, future in enumerate(futures):
+        future.result()
+        if progress:
+            progress((i + 1) / len(futures))
+    return True
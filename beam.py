@@ -0,0 +1,97 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Primary beam models of the antenna dishes.
+# Radial profiles are tabulated once per model as a function of the dimensionless radius theta * D / lambda,
+# beam images for a given dish, frequency and image grid are cached.
+
+from functools import lru_cache
+import numpy as np
+from .constants import c
+from .wstacking import image_coordinates
+
+beam_model_items = [
+    ('AIRY', "Airy", "Airy pattern of a uniformly illuminated circular dish"),
+    ('GAUSSIAN', "Gaussian", "Gaussian beam with the half power width of the Airy pattern"),
+]
+
+# Full width at half maximum of the Airy pattern in units of lambda / D
+airy_fwhm = 1.029
+
+# Profile tables cover the main lobe and the first sidelobes
+table_max_radius = 8.0
+table_size = 4096
+
+"""
+Bessel function of the first kind of order 1, from its integral representation
+J1(z) = 1/pi * integral of cos(tau - z sin(tau)) over [0, pi], evaluated with the midpoint rule.
+"""
+def bessel_j1(z, num_steps=256):
+    tau = (np.arange(num_steps) + 0.5) * (np.pi / num_steps)
+    integrand = np.cos(tau[None, :] - np.ravel(z)[:, None] * np.sin(tau[None, :]))
+    return np.mean(integrand, axis=1).reshape(np.shape(z))
+
+"""
+Radial power profile of a beam model, sampled at dimensionless radii theta * D / lambda.
+"""
+@lru_cache(maxsize=None)
+def profile_table(model):
+    x = np.linspace(0.0, table_max_radius, table_size)
+    if model == 'AIRY':
+        z = np.pi * x[1:]
+        profile = np.concatenate(([1.0], (2.0 * bessel_j1(z) / z)**2))
+    elif model == 'GAUSSIAN':
+        profile = np.exp(-4.0 * np.log(2.0) * (x / airy_fwhm)**2)
+    else:
+        raise ValueError("Unknown beam model {}".format(model))
+    x.flags.writeable = False
+    profile.flags.writeable = False
+    return x, profile
+
+"""
+Half power beam width in radians.
+"""
+def beam_fwhm(dish_diameter, frequency):
+    return airy_fwhm * c / (frequency * dish_diameter)
+
+"""
+Primary beam power at angular distance radius (radians) from the pointing center.
+"""
+def primary_beam(model, dish_diameter, frequency, radius):
+    x, profile = profile_table(model)
+    return np.interp(np.asarray(radius) * dish_diameter * frequency / c, x, profile, right=0.0)
+
+"""
+Primary beam image on the image grid of the uv scale, for a pointing at direction cosines offset (l0, m0).
+Images are cached per dish, frequency, grid and pointing and must not be modified.
+"""
+@lru_cache(maxsize=64)
+def beam_image(model, dish_diameter, frequency, width, height, scale, l0=0.0, m0=0.0):
+    l, m, _ = image_coordinates(width, height, scale)
+    image = primary_beam(model, dish_diameter, frequency, np.hypot(l - l0, m - m0))
+    image.flags.writeable = False
+    return image
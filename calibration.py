@@ -0,0 +1,218 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Simulated antenna gain errors and gain calibration with StefCal
+# (Salvini & Wijnholds 2014, "Fast gain calibration in radio astronomy using alternating direction implicit methods").
+# Gains are applied in bulk to the simulated visibilities of the visibility store,
+# all time slots are solved at once with batched matrix operations.
+
+import time
+import numpy as np
+from .gridding import baseline_pairs
+
+"""
+Generate time-variable complex antenna gains of shape (num_slots, num_antennas).
+Each antenna has a random static error plus a smooth drift over the slots,
+amplitude_error is the relative amplitude scatter and phase_error the phase scatter in radians.
+"""
+def generate_gains(num_antennas, num_slots, amplitude_error, phase_error, drift_slots=100.0, seed=None):
+    rng = np.random.default_rng(seed)
+    # Smooth drift from a few low-frequency sinusoids per antenna
+    t = np.arange(num_slots)[:, None, None] / max(drift_slots, 1.0)
+    freq = rng.uniform(0.1, 1.0, size=(1, num_antennas, 3))
+    offset = rng.uniform(0.0, 2.0 * np.pi, size=(2, 1, num_antennas, 3))
+    drift_amp = np.sum(np.sin(2.0 * np.pi * freq * t + offset[0]), axis=2) / 3.0
+    drift_phase = np.sum(np.sin(2.0 * np.pi * freq * t + offset[1]), axis=2) / 3.0
+
+    amplitude = 1.0 + amplitude_error * (rng.standard_normal(num_antennas) + drift_amp)
+    phase = phase_error * (rng.standard_normal(num_antennas) + drift_phase)
+    return amplitude * np.exp(1j * phase)
+
+"""
+Solve antenna gains for a batch of slots with StefCal.
+observed and model are (S, N, N) visibility matrices, returns gains (S, N), the number of iterations per slot
+and a boolean array of slots that converged within max_iterations.
+If model is None a unit point source at the phase center is assumed, which avoids a second matrix product per iteration.
+Converged slots are removed from the active set, so the cost of each iteration shrinks as slots converge.
+"""
+def stefcal(observed, model=None, max_iterations=100, tolerance=1.0e-6):
+    num_slots, num_antennas = observed.shape[:2]
+    gains = np.ones((num_slots, num_antennas), dtype=np.complex128)
+    iterations = np.full(num_slots, max_iterations, dtype=np.int64)
+    converged = np.zeros(num_slots, dtype=bool)
+
+    # The update for antenna p with fixed gains g is: g_p = sum_q V_pq conj(M_pq) g_q / sum_q |M_pq|^2 |g_q|^2
+    if model is None:
+        vm = observed
+        mm = None
+    else:
+        vm = observed * np.conj(model)
+        mm = np.abs(model)**2
+    active = np.arange(num_slots)
+    for k in range(max_iterations):
+        g = gains[active]
+        numerator = np.matmul(vm, g[..., None].astype(vm.dtype))[..., 0].astype(np.complex128)
+        if mm is None:
+            # Unit model with zero diagonal
+            g2 = np.abs(g)**2
+            denominator = np.sum(g2, axis=1, keepdims=True) - g2
+        else:
+            denominator = np.matmul(mm, (np.abs(g)**2)[..., None])[..., 0]
+        g_new = np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0.0)
+        # Averaging every second iteration damps the oscillation of the alternating updates
+        if k % 2 == 1:
+            g_new = 0.5 * (g_new + g)
+        change = np.linalg.norm(g_new - g, axis=1) / np.maximum(np.linalg.norm(g_new, axis=1), 1.0e-30)
+        gains[active] = g_new
+
+        done = change < tolerance
+        if np.any(done):
+            iterations[active[done]] = k + 1
+            converged[active[done]] = True
+            active = active[~done]
+            if len(active) == 0:
+                break
+            # Compact the matrices only when slots converge, indexing copies them
+            vm = vm[~done]
+            if mm is not None:
+                mm = mm[~done]
+    return gains, iterations, converged
+
+"""
+Remove the unconstrained common phase of gain solutions by referencing all antennas to the first antenna.
+"""
+def reference_phase(gains):
+    ref = gains[..., :1]
+    return gains * np.conj(ref) / np.maximum(np.abs(ref), 1.0e-30)
+
+"""
+Time slot of samples, slots divide the time range [start, end] evenly.
+"""
+def time_slots(times, start, end, num_slots):
+    if end <= start:
+        return np.zeros(len(times), dtype=np.int64)
+    slots = np.floor((times - start) / (end - start) * num_slots).astype(np.int64)
+    return np.clip(slots, 0, num_slots - 1)
+
+"""
+Corrupt the visibilities of a store with antenna gains and solve for the gains with StefCal.
+Each sample of baseline (p, q) in time slot s is multiplied by g_sp conj(g_sq) of true_gains (S, N),
+the uncorrupted store visibilities are the calibration model. The store itself is not modified.
+Samples are averaged into dense (N, N) matrices per slot, batches of slots are bounded by max_batch_bytes
+and only read the store chunks that overlap them, which is a single pass for time-ordered stores.
+noise is the standard deviation of complex Gaussian noise added to each visibility of unit weight.
+Slots without samples keep unit gains and are left out of the statistics.
+Returns the solved gains and a dictionary of convergence and timing statistics,
+or None if no slot has weighted samples and there is nothing to calibrate.
+"""
+def calibrate_store(store, true_gains, noise=0.0, max_iterations=100, tolerance=1.0e-6,
+                    chunk_size=1 << 20, max_batch_bytes=1 << 28, seed=None):
+    if len(store) == 0:
+        return None
+    start_time = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    num_slots, num_antennas = true_gains.shape
+    pair_p, pair_q = baseline_pairs(num_antennas)
+    diagonal = np.arange(num_antennas)
+
+    # Slot range of each store chunk
+    times = store.column("time")
+    start, end = float(np.min(times)), float(np.max(times))
+    chunk_ranges = []
+    for a in range(0, len(store), chunk_size):
+        slots = time_slots(times[a:a + chunk_size], start, end, num_slots)
+        chunk_ranges.append((a, int(np.min(slots)), int(np.max(slots))))
+    columns = {name: store.column(name) for name in ("time", "baseline", "weight", "vis")}
+
+    # Observed and model sums plus weights per matrix element
+    batch_slots = int(np.clip(max_batch_bytes // (40 * num_antennas * num_antennas), 1, num_slots))
+    solved = np.empty_like(true_gains)
+    iterations = np.empty(num_slots, dtype=np.int64)
+    converged = np.empty(num_slots, dtype=bool)
+    has_data = np.empty(num_slots, dtype=bool)
+    solve_time = 0.0
+    for s0 in range(0, num_slots, batch_slots):
+        s1 = min(s0 + batch_slots, num_slots)
+        size = (s1 - s0) * num_antennas * num_antennas
+        observed = np.zeros(size, dtype=np.complex128)
+        model = np.zeros(size, dtype=np.complex128)
+        weight_sum = np.zeros(size)
+        for a, slot_min, slot_max in chunk_ranges:
+            if slot_max < s0 or slot_min >= s1:
+                continue
+            chunk = {name: np.array(m[a:a + chunk_size]) for name, m in columns.items()}
+            slots = time_slots(chunk["time"], start, end, num_slots)
+            mask = (slots >= s0) & (slots < s1)
+            slots = slots[mask]
+            p = pair_p[chunk["baseline"][mask]]
+            q = pair_q[chunk["baseline"][mask]]
+            weight = chunk["weight"][mask].astype(np.float64)
+            vis = chunk["vis"][mask].astype(np.complex128)
+
+            corrupted = true_gains[slots, p] * vis * np.conj(true_gains[slots, q])
+            if noise > 0.0:
+                sigma = noise / np.sqrt(2.0 * np.maximum(weight, 1.0e-30))
+                corrupted += sigma * (rng.standard_normal(len(vis)) + 1j * rng.standard_normal(len(vis)))
+
+            index = ((slots - s0) * num_antennas + p) * num_antennas + q
+            for total, values in ((observed, weight * corrupted), (model, weight * vis)):
+                total += np.bincount(index, weights=values.real, minlength=size)
+                total += 1j * np.bincount(index, weights=values.imag, minlength=size)
+            weight_sum += np.bincount(index, weights=weight, minlength=size)
+
+        shape = (s1 - s0, num_antennas, num_antennas)
+        has_data[s0:s1] = np.any(weight_sum.reshape(s1 - s0, -1) > 0.0, axis=1)
+        observed = np.divide(observed, weight_sum, out=np.zeros_like(observed), where=weight_sum > 0.0).reshape(shape)
+        model = np.divide(model, weight_sum, out=np.zeros_like(model), where=weight_sum > 0.0).reshape(shape)
+        # Samples only cover p < q, the matrices are Hermitian with zero diagonal
+        observed += np.conj(np.swapaxes(observed, 1, 2))
+        model += np.conj(np.swapaxes(model, 1, 2))
+        observed[:, diagonal, diagonal] = 0.0
+        model[:, diagonal, diagonal] = 0.0
+
+        solve_start = time.perf_counter()
+        solved[s0:s1], iterations[s0:s1], converged[s0:s1] = stefcal(observed, model, max_iterations, tolerance)
+        solve_time += time.perf_counter() - solve_start
+
+    if not np.any(has_data):
+        return None
+    # Slots without samples have no solution and are left out of the statistics
+    solved[~has_data] = 1.0
+    error = reference_phase(solved[has_data]) - reference_phase(true_gains[has_data])
+    stats = {
+        "num_antennas": num_antennas,
+        "num_slots": num_slots,
+        "num_empty_slots": int(np.sum(~has_data)),
+        "num_samples": len(store),
+        "converged": float(np.mean(converged[has_data])),
+        "mean_iterations": float(np.mean(iterations[has_data])),
+        "max_iterations": int(np.max(iterations[has_data])),
+        "rms_error": float(np.sqrt(np.mean(np.abs(error)**2))),
+        "solve_time": solve_time,
+        "total_time": time.perf_counter() - start_time,
+    }
+    return solved, stats
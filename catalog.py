@@ -0,0 +1,213 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Source catalogs with a spatial index for fast field-of-view queries.
+# Sources are sorted into cells of a uniform 3D grid over their unit direction vectors,
+# cone queries only test the sources of cells that can intersect the cone.
+# The sorted columns and the index are cached next to the catalog file.
+
+import os
+import numpy as np
+
+# Target number of sources per index cell
+sources_per_cell = 16
+
+"""
+Array-backed source catalog with a unit vector grid index.
+Columns are stored in cell order: ra and dec in radians, flux in Jy.
+"""
+class SourceCatalog:
+    def __init__(self, ra, dec, flux, cell_size=None):
+        ra = np.asarray(ra, dtype=np.float64)
+        dec = np.asarray(dec, dtype=np.float64)
+        flux = np.asarray(flux, dtype=np.float32)
+        if cell_size is None:
+            # Cells of area s^2 on the unit sphere (area 4 pi) with the target number of sources each
+            cell_size = np.sqrt(4.0 * np.pi * sources_per_cell / max(len(ra), 1))
+        self.cell_size = float(np.clip(cell_size, 1.0e-3, 0.5))
+        self.grid_res = int(np.ceil(2.0 / self.cell_size)) + 1
+
+        keys = self._cell_keys(self._unit_vectors(ra, dec))
+        order = np.argsort(keys, kind='stable')
+        self.ra = ra[order]
+        self.dec = dec[order]
+        self.flux = flux[order]
+        self.cell_keys, self.cell_start = np.unique(keys[order], return_index=True)
+        self.cell_start = np.append(self.cell_start, len(order))
+        self._init_cell_centers()
+
+    def __len__(self):
+        return len(self.ra)
+
+    @staticmethod
+    def _unit_vectors(ra, dec):
+        cd = np.cos(dec)
+        return np.stack((cd * np.cos(ra), cd * np.sin(ra), np.sin(dec)), axis=-1)
+
+    def _cell_keys(self, vectors):
+        coords = np.floor((vectors + 1.0) / self.cell_size).astype(np.int64)
+        return (coords[:, 0] * self.grid_res + coords[:, 1]) * self.grid_res + coords[:, 2]
+
+    def _init_cell_centers(self):
+        res = self.grid_res
+        coords = np.stack((self.cell_keys // (res * res), (self.cell_keys // res) % res, self.cell_keys % res), axis=1)
+        self.cell_centers = (coords + 0.5) * self.cell_size - 1.0
+
+    """
+    Indices of all sources within radius (radians) of the direction (ra, dec).
+    """
+    def cone(self, ra, dec, radius):
+        radius = min(radius, np.pi)
+        target = self._unit_vectors(np.float64(ra), np.float64(dec))
+        chord = 2.0 * np.sin(0.5 * radius)
+        # The cone cap lies inside the ball of radius chord around the target vector
+        lo = np.maximum(np.floor((target - chord + 1.0) / self.cell_size).astype(np.int64), 0)
+        hi = np.minimum(np.floor((target + chord + 1.0) / self.cell_size).astype(np.int64), self.grid_res - 1)
+        if np.prod(hi - lo + 1) < len(self.cell_keys):
+            # Small cones: look up the cells of the bounding cube
+            ix, iy, iz = np.meshgrid(*(np.arange(a, b + 1) for a, b in zip(lo, hi)), indexing='ij')
+            keys = ((ix * self.grid_res + iy) * self.grid_res + iz).ravel()
+            cells = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+            cells = cells[self.cell_keys[cells] == keys]
+        else:
+            # Large cones: cells whose bounding sphere intersects the ball
+            reach = chord + 0.5 * np.sqrt(3.0) * self.cell_size
+            cells = np.flatnonzero(np.sum((self.cell_centers - target)**2, axis=1) <= reach * reach)
+
+        start = self.cell_start[cells]
+        count = self.cell_start[cells + 1] - start
+        group_start = np.cumsum(count) - count
+        candidates = np.repeat(start - group_start, count) + np.arange(np.sum(count))
+
+        vectors = self._unit_vectors(self.ra[candidates], self.dec[candidates])
+        return candidates[vectors @ target >= np.cos(radius)]
+
+    def save(self, filepath, source_stat=None):
+        np.savez(filepath, ra=self.ra, dec=self.dec, flux=self.flux,
+                 cell_size=self.cell_size, cell_keys=self.cell_keys, cell_start=self.cell_start,
+                 source_stat=np.array(source_stat if source_stat is not None else (0, 0), dtype=np.int64))
+
+    @classmethod
+    def from_index_file(cls, filepath):
+        data = np.load(filepath)
+        catalog = cls.__new__(cls)
+        catalog.ra = data["ra"]
+        catalog.dec = data["dec"]
+        catalog.flux = data["flux"]
+        catalog.cell_size = float(data["cell_size"])
+        catalog.grid_res = int(np.ceil(2.0 / catalog.cell_size)) + 1
+        catalog.cell_keys = data["cell_keys"]
+        catalog.cell_start = data["cell_start"]
+        catalog._init_cell_centers()
+        return catalog, tuple(data["source_stat"])
+
+
+def _read_columns(filepath):
+    if filepath.lower().endswith(".npy"):
+        data = np.load(filepath, mmap_mode='r')
+        if data.dtype.names:
+            return data["ra"], data["dec"], data["flux"]
+        return data[:, 0], data[:, 1], data[:, 2]
+
+    # CSV with a header line, ra and dec in degrees
+    with open(filepath, 'r') as f:
+        names = [n.strip().lower() for n in f.readline().split(',')]
+    usecols = [names.index(n) if n in names else k for k, n in enumerate(("ra", "dec", "flux"))]
+    data = np.loadtxt(filepath, delimiter=',', skiprows=1, usecols=usecols, dtype=np.float64, ndmin=2)
+    return data[:, 0], data[:, 1], data[:, 2]
+
+"""
+Load a catalog from CSV or NPY (ra and dec in degrees, flux in Jy).
+The sorted columns and the index are cached in a .index.npz file next to the catalog
+and reused as long as the catalog file is unchanged.
+"""
+def load_catalog(filepath):
+    stat = os.stat(filepath)
+    source_stat = (stat.st_size, stat.st_mtime_ns)
+    index_path = filepath + ".index.npz"
+    if os.path.exists(index_path):
+        try:
+            catalog, cached_stat = SourceCatalog.from_index_file(index_path)
+            if cached_stat == source_stat:
+                return catalog
+        except (OSError, ValueError, KeyError):
+            pass
+
+    ra, dec, flux = _read_columns(filepath)
+    catalog = SourceCatalog(np.radians(ra), np.radians(dec), flux)
+    try:
+        catalog.save(index_path, source_stat)
+    except OSError:
+        pass
+    return catalog
+
+_catalogs = {}
+
+"""
+Get a loaded catalog, catalogs stay in memory until the file changes.
+"""
+def get_catalog(filepath):
+    stat = os.stat(filepath)
+    key = (stat.st_size, stat.st_mtime_ns)
+    entry = _catalogs.get(filepath)
+    if entry is None or entry[0] != key:
+        entry = (key, load_catalog(filepath))
+        _catalogs[filepath] = entry
+    return entry[1]
+
+"""
+Direction cosines (l, m) and n - 1 of sources relative to the phase center (ra0, dec0), using the sine projection.
+"""
+def direction_cosines(ra, dec, ra0, dec0):
+    dra = ra - ra0
+    l = np.cos(dec) * np.sin(dra)
+    m = np.sin(dec) * np.cos(dec0) - np.cos(dec) * np.sin(dec0) * np.cos(dra)
+    n = np.sin(dec) * np.sin(dec0) + np.cos(dec) * np.cos(dec0) * np.cos(dra)
+    return l, m, n - 1.0
+
+"""
+Predict visibilities of point sources for samples with uvw coordinates in wavelengths.
+Samples and sources are processed in blocks of at most max_block_elements phase terms,
+which bounds the size of the phase matrix independent of the number of samples.
+"""
+def predict_visibilities(u, v, w, l, m, n_minus_1, flux, chunk_sources=256, max_block_elements=1 << 24):
+    vis = np.zeros(np.shape(u), dtype=np.complex128)
+    u, v, w = np.ravel(u), np.ravel(v), np.ravel(w)
+    flat = vis.reshape(-1)
+    flux = np.asarray(flux, dtype=np.float64)
+    chunk_sources = max(1, min(chunk_sources, len(l)))
+    chunk_samples = max(1, max_block_elements // chunk_sources)
+    for s0 in range(0, len(flat), chunk_samples):
+        s1 = min(s0 + chunk_samples, len(flat))
+        for a in range(0, len(l), chunk_sources):
+            b = min(a + chunk_sources, len(l))
+            phase = np.outer(u[s0:s1], l[a:b])
+            phase += np.outer(v[s0:s1], m[a:b])
+            phase += np.outer(w[s0:s1], n_minus_1[a:b])
+            phase *= -2.0 * np.pi
+            flat[s0:s1] += np.exp(1j * phase) @ flux[a:b]
+    return vis
@@ -29,8 +29,13 @@ from bpy.types import PropertyGroup
 from mathutils import Vector, Quaternion, Euler, Matrix
 import time
 from math import *
+import numpy as np
 import re
 
+# Length of sidereal day
+solar_to_sidereal = 366.24/365.24
+sidereal_to_solar = 365.24/366.24
+
 def hour_to_angle(hourstr):
     t = time.strptime(hourstr, "%Hh%Mm%Ss")
     return 2.0 * pi * (t.tm_hour + (t.tm_min + t.tm_sec / 60) / 60) / 24
@@ -149,3 +154,70 @@ def equatorial_to_horizontal(co, observer, sidereal_angle):
     A = atan2(sin(h), cos(h)*sobs - tan(delta)*cobs)
     a = asin(sin(delta)*sobs + cos(delta)*cos(h)*cobs)
     return (A, a)
+
+"""
+Earth rotation angle for arrays of days and hours since the J2000 epoch.
+Vectorized version of TimeProp.earth_rotation.
+"""
+def earth_rotation_angles(day, hour):
+    f = np.modf((np.asarray(day, dtype=np.float64) + np.asarray(hour, dtype=np.float64) / 24.0) * solar_to_sidereal)[0]
+    return np.where(f > 0.0, f, 1.0 - f) * 2*pi
+
+def rotation_matrices_x(angle):
+    angle = np.asarray(angle, dtype=np.float64)
+    c, s = np.cos(angle), np.sin(angle)
+    one, zero = np.ones_like(angle), np.zeros_like(angle)
+    return np.stack((
+        np.stack((one, zero, zero), axis=-1),
+        np.stack((zero, c, -s), axis=-1),
+        np.stack((zero, s, c), axis=-1),
+        ), axis=-2)
+
+def rotation_matrices_y(angle):
+    angle = np.asarray(angle, dtype=np.float64)
+    c, s = np.cos(angle), np.sin(angle)
+    one, zero = np.ones_like(angle), np.zeros_like(angle)
+    return np.stack((
+        np.stack((c, zero, s), axis=-1),
+        np.stack((zero, one, zero), axis=-1),
+        np.stack((-s, zero, c), axis=-1),
+        ), axis=-2)
+
+"""
+Rotation matrices of the target frame in horizontal coordinates for an array of earth rotation angles.
+Vectorized version of InterferometrySettings.target_rotation, returns an array of shape (..., 3, 3).
+location and target are (longitude, latitude) pairs.
+"""
+def target_rotation_matrices(location, target, earth_rotation):
+    return rotation_matrices_x(location[1]) @ rotation_matrices_y(-location[0] - np.asarray(earth_rotation) - target[0]) @ rotation_matrices_x(target[1])
+
+
+# Obliquity of the ecliptic at J2000
+ecliptic_obliquity = radians(23.4392911)
+
+# Rotation from equatorial (J2000) to ecliptic coordinates
+ecliptic_matrix = rotation_matrices_x(-ecliptic_obliquity)
+
+# Rotation from equatorial (J2000) to galactic coordinates
+galactic_matrix = np.array([
+    [-0.0548755604, -0.8734370902, -0.4838350155],
+    [ 0.4941094279, -0.4448296300,  0.7469822445],
+    [-0.8676661490, -0.1980763734,  0.4559837762],
+    ])
+
+"""
+Unit vectors of (longitude, latitude) arrays, in a frame with the x axis at longitude 0 and the z axis at the pole.
+"""
+def spherical_to_vectors(longitude, latitude):
+    cl = np.cos(latitude)
+    return np.stack((cl * np.cos(longitude), cl * np.sin(longitude), np.sin(latitude)), axis=-1)
+
+def vectors_to_spherical(vectors):
+    return np.arctan2(vectors[..., 1], vectors[..., 0]), np.arcsin(np.clip(vectors[..., 2], -1.0, 1.0))
+
+"""
+Convert arrays of equatorial coordinates into the frame of a rotation matrix from equatorial coordinates,
+e.g. ecliptic_matrix or galactic_matrix. Returns (longitude, latitude) arrays.
+"""
+def equatorial_to_frame(ra, dec, matrix):
+    return vectors_to_spherical(spherical_to_vectors(ra, dec) @ np.asarray(matrix).T)
@@ -0,0 +1,198 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+import numpy as np
+from .redundancy import group_redundant
+
+"""
+Uniform grid hash over 2D points for fast nearest-neighbor queries.
+Points are sorted by cell, a dense table of cell start offsets allows looking up the points of any cell in constant time.
+"""
+class GridHash:
+    def __init__(self, points, cell_size=None):
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        n = len(self.points)
+        lo = np.min(self.points, axis=0) if n > 0 else np.zeros(2)
+        hi = np.max(self.points, axis=0) if n > 0 else np.ones(2)
+        extent = np.maximum(hi - lo, 1.0e-12)
+        if cell_size is None:
+            # Aim for about one point in every two cells, which keeps candidate pairs low for clustered points
+            cell_size = np.sqrt(extent[0] * extent[1] * 0.5 / max(n, 1))
+        self.cell_size = max(float(cell_size), 1.0e-12)
+        self.origin = lo
+        self.dims = np.minimum(np.floor(extent / self.cell_size).astype(np.int64) + 1, 1 << 15)
+        self.cell_size = max(self.cell_size, float(np.max(extent / self.dims)) * (1.0 + 1.0e-9))
+
+        keys = self.cell_keys(self.cell_coords(self.points))
+        self.order = np.argsort(keys, kind='stable')
+        self.sorted_points = self.points[self.order]
+        counts = np.bincount(keys, minlength=self.dims[0] * self.dims[1])
+        self.cell_start = np.concatenate(([0], np.cumsum(counts)))
+        self.max_occupancy = int(np.max(counts)) if n > 0 else 0
+
+    def cell_coords(self, points):
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def cell_keys(self, coords):
+        return coords[:, 0] * self.dims[1] + coords[:, 1]
+
+    """
+    Distance from each query point to the nearest point of the hash.
+    If exclude is given it contains for each query the point index to ignore (e.g. the query point itself), or -1.
+    Returns inf for queries without any point found.
+    Queries are processed in chunks to bound the memory used for candidate pairs.
+    """
+    def nearest_distance(self, queries, exclude=None, chunk_size=1 << 16):
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 2)
+        best = np.full(len(queries), np.inf)
+        if len(self.points) == 0:
+            return best
+        if exclude is None:
+            exclude = np.full(len(queries), -1, dtype=np.int64)
+        for start in range(0, len(queries), chunk_size):
+            stop = min(start + chunk_size, len(queries))
+            best[start:stop] = self._nearest_distance_chunk(queries[start:stop], exclude[start:stop])
+        return best
+
+    def _nearest_distance_chunk(self, queries, exclude):
+        best = np.full(len(queries), np.inf)
+        qcell = self.cell_coords(queries)
+        active = np.arange(len(queries))
+        max_ring = int(np.max(self.dims)) + 1
+        for ring in range(max_ring + 1):
+            if len(active) == 0:
+                break
+            for offset in _ring_offsets(ring):
+                cell = qcell[active] + offset
+                inside = np.all((cell >= 0) & (cell < self.dims), axis=1)
+                keys = self.cell_keys(cell[inside])
+                start = self.cell_start[keys]
+                count = self.cell_start[keys + 1] - start
+                occupied = count > 0
+                q = active[inside][occupied]
+                start = start[occupied]
+                count = count[occupied]
+                if len(q) == 0:
+                    continue
+
+                # Expand all (query, point) pairs of the cell, pairs of each query are contiguous
+                group_start = np.cumsum(count) - count
+                pair_query = np.repeat(q, count)
+                sorted_index = np.repeat(start - group_start, count) + np.arange(len(pair_query))
+                d = np.hypot(*(self.sorted_points[sorted_index] - queries[pair_query]).T)
+                d[self.order[sorted_index] == exclude[pair_query]] = np.inf
+                best[q] = np.minimum(best[q], np.minimum.reduceat(d, group_start))
+            # Points in further rings are at least ring * cell_size away
+            active = active[best[active] > ring * self.cell_size]
+        return best
+
+
+def _ring_offsets(ring):
+    if ring == 0:
+        return np.zeros((1, 2), dtype=np.int64)
+    r = np.arange(-ring, ring + 1)
+    edges = [
+        np.stack((r, np.full_like(r, -ring)), axis=1),
+        np.stack((r, np.full_like(r, ring)), axis=1),
+        np.stack((np.full_like(r[1:-1], -ring), r[1:-1]), axis=1),
+        np.stack((np.full_like(r[1:-1], ring), r[1:-1]), axis=1),
+    ]
+    return np.concatenate(edges)
+
+"""
+Find the largest empty circles inside the coverage disk.
+Candidate centers on a regular grid are scored by the distance to the nearest sample,
+the largest holes are selected greedily so that no center lies inside an already selected hole.
+Returns a list of (u, v, radius) tuples.
+"""
+def find_holes(points, radius, resolution=128, max_holes=8):
+    t = np.linspace(-radius, radius, resolution)
+    cu, cv = np.meshgrid(t, t)
+    candidates = np.stack((cu.ravel(), cv.ravel()), axis=1)
+    candidates = candidates[np.hypot(candidates[:, 0], candidates[:, 1]) <= radius]
+    # Cells matching the candidate spacing keep the number of search rings low for large holes
+    index = GridHash(points, cell_size=2.0 * radius / resolution)
+    distance = index.nearest_distance(candidates)
+
+    holes = []
+    order = np.argsort(-distance)
+    for i in order:
+        if len(holes) >= max_holes:
+            break
+        u, v = candidates[i]
+        r = distance[i]
+        if not np.isfinite(r) or r <= 0.0:
+            break
+        if any(np.hypot(u - hu, v - hv) < hr for hu, hv, hr in holes):
+            continue
+        holes.append((float(u), float(v), float(r)))
+    return holes
+
+"""
+Compute coverage statistics for a set of baselines in the uv plane.
+uv is an (M, 2) array of baseline vectors, mirrored samples are added internally.
+tolerance is the distance below which baselines are considered redundant.
+Returns a dictionary of statistics and histograms.
+"""
+def analyze_coverage(uv, tolerance=1.0e-3, radial_bins=32, azimuthal_bins=36, max_holes=8):
+    uv = np.asarray(uv, dtype=np.float64).reshape(-1, 2)
+    if len(uv) == 0:
+        return None
+
+    lengths = np.hypot(uv[:, 0], uv[:, 1])
+    max_length = float(np.max(lengths))
+
+    unique_uv, inverse, counts, _ = group_redundant(uv, tolerance)
+    # Both the baseline and its mirror are sampled
+    points = np.concatenate((unique_uv, -unique_uv))
+    index = GridHash(points)
+    # The point set is symmetric, so mirrored points have the same nearest neighbor distance
+    spacing = index.nearest_distance(unique_uv, exclude=np.arange(len(unique_uv)))
+    spacing = spacing[np.isfinite(spacing)]
+
+    radial, radial_edges = np.histogram(lengths, bins=radial_bins, range=(0.0, max_length))
+    azimuth = np.mod(np.arctan2(uv[:, 1], uv[:, 0]), np.pi)
+    azimuthal, azimuthal_edges = np.histogram(azimuth, bins=azimuthal_bins, range=(0.0, np.pi))
+
+    holes = find_holes(points, max_length, max_holes=max_holes) if max_length > 0.0 else []
+
+    return {
+        "num_baselines": len(uv),
+        "num_unique": len(unique_uv),
+        "max_redundancy": int(np.max(counts)),
+        "mean_redundancy": float(np.mean(counts)),
+        "min_baseline": float(np.min(lengths)),
+        "max_baseline": max_length,
+        "min_spacing": float(np.min(spacing)) if len(spacing) > 0 else 0.0,
+        "max_spacing": float(np.max(spacing)) if len(spacing) > 0 else 0.0,
+        "radial_histogram": radial.tolist(),
+        "radial_bin_edges": radial_edges.tolist(),
+        "azimuthal_histogram": azimuthal.tolist(),
+        "azimuthal_bin_edges": azimuthal_edges.tolist(),
+        "redundancy_histogram": np.bincount(counts).tolist(),
+        "holes": holes,
+    }
@@ -26,6 +26,11 @@
 
 import bpy
 from bpy.app.handlers import persistent
+from mathutils import Matrix
+import numpy as np
+import os
+from .coordinates import ecliptic_matrix, galactic_matrix
+from . import grid_overlay
 
 
 def get_nodegroup(create=False):
@@ -34,6 +39,95 @@ def get_nodegroup(create=False):
         nodegroup = bpy.data.node_groups.new("ObservatorySettings", 'ShaderNodeTree')
     return nodegroup
 
+# Mapping of node group output names to (index, identifier) of input sockets of the group output node.
+# The mapping is rebuilt only when the node group structure changes,
+# socket objects are not kept since they become invalid after undo and file load.
+_socket_cache = {"signature": None, "node": None, "sockets": {}, "values": {}}
+
+# Scenes with pending node group updates, flushed once per event loop tick
+_pending_nodegroup_updates = set()
+
+def invalidate_socket_cache():
+    _socket_cache["signature"] = None
+    _socket_cache["node"] = None
+    _socket_cache["sockets"] = {}
+    _socket_cache["values"] = {}
+
+def _get_output_node(nodegroup):
+    node = _socket_cache["node"]
+    if node is not None:
+        node = nodegroup.nodes.get(node)
+    if node is None or node.type != 'GROUP_OUTPUT':
+        node = next((n for n in nodegroup.nodes if n.type=='GROUP_OUTPUT'), None)
+    if node is None:
+        node = nodegroup.nodes.new("NodeGroupOutput")
+    return node
+
+def _get_socket_map(nodegroup):
+    node = _get_output_node(nodegroup)
+    signature = (nodegroup.as_pointer(), node.as_pointer(), len(node.inputs), tuple(output.name for output in nodegroup.outputs))
+    if _socket_cache["signature"] != signature:
+        names = {output.identifier: output.name for output in nodegroup.outputs}
+        _socket_cache["signature"] = signature
+        _socket_cache["node"] = node.name
+        _socket_cache["sockets"] = {names[s.identifier]: (index, s.identifier)
+                                    for index, s in enumerate(node.inputs) if s.identifier in names}
+        _socket_cache["values"] = {}
+    return node, _socket_cache["sockets"]
+
+def _find_socket(node, index, identifier):
+    if index < len(node.inputs) and node.inputs[index].identifier == identifier:
+        return node.inputs[index]
+    return next((s for s in node.inputs if s.identifier == identifier), None)
+
+"""
+Request a node group update for the scene.
+Multiple requests before the next event loop tick are coalesced into a single update.
+Timers don't run in background mode, the node group is updated immediately there.
+"""
+def request_nodegroup_update(scene):
+    if bpy.app.background:
+        update_nodegroup(scene, bpy.context)
+        return
+    _pending_nodegroup_updates.add(scene.name)
+    if not bpy.app.timers.is_registered(_flush_nodegroup_updates):
+        bpy.app.timers.register(_flush_nodegroup_updates, first_interval=0.0, persistent=True)
+
+def _flush_nodegroup_updates():
+    names = list(_pending_nodegroup_updates)
+    _pending_nodegroup_updates.clear()
+    for name in names:
+        scene = bpy.data.scenes.get(name)
+        if scene is not None:
+            update_nodegroup(scene, bpy.context)
+    # Unregister the timer
+    return None
+
+"""
+Apply pending node group updates before rendering or changing frames.
+"""
+@persistent
+def flush_nodegroup_handler(scene, depsgraph=None):
+    if _pending_nodegroup_updates:
+        _flush_nodegroup_updates()
+
+"""
+Drop cached sockets and pending updates of the previous file.
+"""
+@persistent
+def nodegroup_load_handler(scene):
+    _pending_nodegroup_updates.clear()
+    if bpy.app.timers.is_registered(_flush_nodegroup_updates):
+        bpy.app.timers.unregister(_flush_nodegroup_updates)
+    invalidate_socket_cache()
+
+"""
+Cached sockets are invalid after undo.
+"""
+@persistent
+def nodegroup_undo_handler(scene):
+    invalidate_socket_cache()
+
 def update_nodegroup(scene, context):
     observatory = scene.observatory
     interferometry = scene.interferometry
@@ -41,29 +135,40 @@ def update_nodegroup(scene, context):
     nodegroup = get_nodegroup()
     if nodegroup is None:
         return
-    node = next((n for n in nodegroup.nodes if n.type=='GROUP_OUTPUT'), None)
-    if node is None:
-        node = nodegroup.nodes.new("NodeGroupOutput")
+    node, sockets = _get_socket_map(nodegroup)
 
     def ensure_output(prop, value, type):
-        output = nodegroup.outputs.get(prop)
-        if output is None:
-            output = nodegroup.outputs.new(type, prop)
-        socket = next((s for s in node.inputs if s.identifier==output.identifier))
-        socket.default_value = value
+        nonlocal node, sockets
+        entry = sockets.get(prop)
+        if entry is None:
+            nodegroup.outputs.new(type, prop)
+            node, sockets = _get_socket_map(nodegroup)
+            entry = sockets[prop]
+        # Only write changed values, every write can trigger shader recompilation
+        if hasattr(value, "__len__"):
+            value = tuple(value)
+        values = _socket_cache["values"]
+        if values.get(prop) != value:
+            socket = _find_socket(node, *entry)
+            if socket is not None:
+                socket.default_value = value
+                values[prop] = value
 
     ensure_output("Location Longitude", observatory.location.longitude, "NodeSocketFloat")
     ensure_output("Location Latitude", observatory.location.latitude, "NodeSocketFloat")
     ensure_output("Hour", observatory.time.hour, "NodeSocketFloat")
     ensure_output("Sky Background", observatory.bl_rna.properties["sky_background"].enum_items[observatory.sky_background].value, "NodeSocketFloat")
 
-    def ensure_grid_outputs(grid, name):
-        ensure_output("{} Enabled".format(name), grid.enabled, "NodeSocketFloat")
+    def ensure_grid_outputs(grid, name, baked=False):
+        # Baked grids are drawn by the overlay texture instead of the procedural shader
+        ensure_output("{} Enabled".format(name), grid.enabled and not baked, "NodeSocketFloat")
         ensure_output("{} Color".format(name), (*grid.color[:3], 1.0), "NodeSocketColor")
+    baked = observatory.use_baked_grids
     ensure_grid_outputs(observatory.horizontal_grid, "Horizontal Grid")
-    ensure_grid_outputs(observatory.equatorial_grid, "Equatorial Grid")
-    ensure_grid_outputs(observatory.ecliptic_grid, "Ecliptic Grid")
-    ensure_grid_outputs(observatory.galactic_grid, "Galactic Grid")
+    ensure_grid_outputs(observatory.equatorial_grid, "Equatorial Grid", baked)
+    ensure_grid_outputs(observatory.ecliptic_grid, "Ecliptic Grid", baked)
+    ensure_grid_outputs(observatory.galactic_grid, "Galactic Grid", baked)
+    update_grid_overlay(scene)
 
     ensure_output("Target Longitude", interferometry.target.longitude, "NodeSocketFloat")
     ensure_output("Target Latitude", interferometry.target.latitude, "NodeSocketFloat")
@@ -71,6 +176,116 @@ def update_nodegroup(scene, context):
 
 
 
+grid_overlay_id = "GridOverlay"
+grid_overlay_nodegroup_id = "ObservatoryGridOverlay"
+grid_overlay_node_id = "Observatory Grid Overlay"
+grid_overlay_mix_id = "Observatory Grid Overlay Mix"
+
+# Maps directions of the equirectangular texture lookup (z at the pole, u = ra / 2pi)
+# into the equatorial frame of equatorial_rotation (y at the pole, ra = 0 along -z)
+grid_overlay_axes = Matrix(((0.0, 1.0, 0.0), (0.0, 0.0, 1.0), (1.0, 0.0, 0.0)))
+
+# Image pointer and settings of the last baked grid overlay
+_grid_overlay_cache = {"image": None, "signature": None}
+
+def get_grid_overlay_nodegroup(create=False):
+    nodegroup = bpy.data.node_groups.get(grid_overlay_nodegroup_id)
+    if create and nodegroup is None:
+        nodegroup = bpy.data.node_groups.new(grid_overlay_nodegroup_id, 'ShaderNodeTree')
+        nodegroup.outputs.new("NodeSocketColor", "Color")
+        nodegroup.outputs.new("NodeSocketFloat", "Alpha")
+        nodes = nodegroup.nodes
+        coords = nodes.new("ShaderNodeTexCoord")
+        mapping = nodes.new("ShaderNodeMapping")
+        mapping.name = "Equatorial Mapping"
+        mapping.vector_type = 'VECTOR'
+        texture = nodes.new("ShaderNodeTexEnvironment")
+        texture.name = "Grid Texture"
+        texture.projection = 'EQUIRECTANGULAR'
+        output = nodes.new("NodeGroupOutput")
+        nodegroup.links.new(coords.outputs["Generated"], mapping.inputs["Vector"])
+        nodegroup.links.new(mapping.outputs["Vector"], texture.inputs["Vector"])
+        nodegroup.links.new(texture.outputs["Color"], output.inputs["Color"])
+        nodegroup.links.new(texture.outputs["Alpha"], output.inputs["Alpha"])
+    return nodegroup
+
+"""
+Insert the grid overlay into the world shader: the existing surface is mixed with the overlay color by its alpha.
+The mix node is muted when baked grids are disabled.
+"""
+def ensure_world_grid_overlay(world, nodegroup, enabled):
+    if world is None or not world.use_nodes:
+        return
+    tree = world.node_tree
+    mix = tree.nodes.get(grid_overlay_mix_id)
+    if mix is None:
+        if not enabled:
+            return
+        output = next((n for n in tree.nodes if n.type == 'OUTPUT_WORLD' and n.is_active_output), None)
+        if output is None or not output.inputs["Surface"].is_linked:
+            return
+        surface = output.inputs["Surface"].links[0].from_socket
+        group = tree.nodes.new("ShaderNodeGroup")
+        group.name = grid_overlay_node_id
+        group.node_tree = nodegroup
+        background = tree.nodes.new("ShaderNodeBackground")
+        mix = tree.nodes.new("ShaderNodeMixShader")
+        mix.name = grid_overlay_mix_id
+        tree.links.new(group.outputs["Alpha"], mix.inputs["Fac"])
+        tree.links.new(surface, mix.inputs[1])
+        tree.links.new(group.outputs["Color"], background.inputs["Color"])
+        tree.links.new(background.outputs["Background"], mix.inputs[2])
+        tree.links.new(mix.outputs["Shader"], output.inputs["Surface"])
+    if mix.mute == enabled:
+        mix.mute = not enabled
+
+"""
+Bake enabled star-fixed grids into the overlay texture and update the overlay rotation.
+The texture is only regenerated when grid settings change, the horizontal grid stays procedural since it moves with time.
+"""
+def update_grid_overlay(scene):
+    observatory = scene.observatory
+    enabled = observatory.use_baked_grids
+    nodegroup = get_grid_overlay_nodegroup(create=enabled)
+    if nodegroup is None:
+        return
+    ensure_world_grid_overlay(scene.world, nodegroup, enabled)
+    if not enabled:
+        return
+
+    # Lookup directions are rotated from world space into the texture frame
+    rotation = (observatory.equatorial_rotation.to_matrix() @ grid_overlay_axes).inverted().to_euler('XYZ')
+    mapping = nodegroup.nodes["Equatorial Mapping"]
+    if tuple(mapping.inputs["Rotation"].default_value) != tuple(rotation):
+        mapping.inputs["Rotation"].default_value = rotation
+
+    height = observatory.grid_texture_size
+    width = 2 * height
+    grids = [(matrix, tuple(grid.color[:3]))
+             for grid, matrix in ((observatory.equatorial_grid, np.identity(3)),
+                                  (observatory.ecliptic_grid, ecliptic_matrix),
+                                  (observatory.galactic_grid, galactic_matrix))
+             if grid.enabled]
+    signature = (width, height, observatory.grid_line_width, tuple(color for _, color in grids),
+                 tuple(grid.enabled for grid in (observatory.equatorial_grid, observatory.ecliptic_grid, observatory.galactic_grid)))
+
+    image = bpy.data.images.get(grid_overlay_id)
+    if image is None:
+        image = bpy.data.images.new(grid_overlay_id, width, height, alpha=True, float_buffer=True)
+    texture = nodegroup.nodes["Grid Texture"]
+    if texture.image != image:
+        texture.image = image
+    if _grid_overlay_cache["image"] == image.as_pointer() and _grid_overlay_cache["signature"] == signature:
+        return
+
+    if image.generated_width != width:
+        image.generated_width = width
+    if image.generated_height != height:
+        image.generated_height = height
+    image.pixels.foreach_set(grid_overlay.bake_grid_overlay(width, height, grids, observatory.grid_line_width))
+    _grid_overlay_cache["image"] = image.as_pointer()
+    _grid_overlay_cache["signature"] = signature
+
 def get_image_data_prop(name, create=False, width=128, height=128):
     img = bpy.data.images.get(name)
     if create and img is None:
@@ -89,11 +304,153 @@ def get_image_data_prop(name, create=False, width=128, height=128):
 def get_antenna_collection():
     return bpy.data.collections.get("Observatory")
 
-def find_antennas(context, op=None):
+antenna_source_items = [
+    ('OBJECTS', "Objects", "Each object in the collection is an antenna"),
+    ('VERTICES', "Vertices", "Each vertex of mesh objects in the collection is an antenna"),
+    ('INSTANCES', "Instances", "Each instance generated by objects in the collection is an antenna"),
+]
+
+# Antenna positions per (collection, scene, view layer, source), reused until the collection changes
+_antenna_cache = {}
+
+"""
+Discard cached antenna positions, must be called when objects of the antenna collection are updated.
+"""
+def invalidate_antenna_cache():
+    _antenna_cache.clear()
+
+"""
+View layer for evaluating the antennas of a scene.
+This is the active view layer for the context scene, otherwise the first view layer of the scene used for rendering.
+"""
+def get_scene_view_layer(context, scene):
+    if scene == context.scene and context.view_layer is not None:
+        return context.view_layer
+    return next((view_layer for view_layer in scene.view_layers if view_layer.use), scene.view_layers[0])
+
+def _get_evaluated_depsgraph(context, scene, view_layer):
+    if scene == context.scene and view_layer == context.view_layer:
+        return context.evaluated_depsgraph_get()
+    depsgraph = view_layer.depsgraph
+    # Depsgraphs of scenes that are not shown in a window are not evaluated automatically
+    depsgraph.update()
+    return depsgraph
+
+"""
+Apply a 4x4 transform matrix to an (N, 3) array of points.
+"""
+def transform_points(matrix, points):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    return points @ matrix[:3, :3].T + matrix[:3, 3]
+
+def _object_positions(coll, depsgraph=None):
+    objects = coll.objects
+    if depsgraph is not None:
+        # Evaluated transforms of another scene
+        positions = [obj.evaluated_get(depsgraph).matrix_world.to_translation()[:] for obj in objects]
+        return np.array(positions, dtype=np.float64).reshape(-1, 3)
+    # Note: matrix_world is flattened in column-major order, translation is in the last column
+    matrices = np.empty(len(objects) * 16, dtype=np.float32)
+    objects.foreach_get("matrix_world", matrices)
+    return matrices.reshape(-1, 16)[:, 12:15].astype(np.float64)
+
+def _vertex_positions(coll, depsgraph):
+    result = []
+    for obj in coll.objects:
+        if obj.type != 'MESH':
+            continue
+        obj_eval = obj.evaluated_get(depsgraph)
+        vertices = obj_eval.data.vertices
+        co = np.empty(len(vertices) * 3, dtype=np.float32)
+        vertices.foreach_get("co", co)
+        result.append(transform_points(obj_eval.matrix_world, co.reshape(-1, 3)))
+    if not result:
+        return np.zeros((0, 3))
+    return np.concatenate(result)
+
+def _instance_positions(coll, depsgraph):
+    objects = set(coll.objects)
+    positions = [inst.matrix_world.to_translation()[:] for inst in depsgraph.object_instances
+                 if inst.is_instance and inst.parent is not None and inst.parent.original in objects]
+    return np.array(positions, dtype=np.float64).reshape(-1, 3)
+
+"""
+Find antenna locations as an (N, 3) array.
+The source defines which elements of the Observatory collection are antennas, see antenna_source_items.
+Positions are evaluated in the scene (the context scene by default) through its view layer, see get_scene_view_layer.
+With use_cache positions are only extracted again after invalidate_antenna_cache or when the source changes,
+this is meant for automatic updates. Explicit operator runs always extract current positions.
+"""
+def find_antennas(context, op=None, source=None, use_cache=False, scene=None):
     coll = get_antenna_collection()
     if coll is None:
         if op:
             op.report({'ERROR'}, "Could not find collection 'Observatory' for computing base lines")
         return
-    depsgraph = context.evaluated_depsgraph_get()
-    return [obj.evaluated_get(depsgraph).matrix_world.to_translation() for obj in coll.objects]
+    if scene is None:
+        scene = context.scene
+    if source is None:
+        source = scene.interferometry.antenna_source
+    view_layer = get_scene_view_layer(context, scene)
+
+    key = (coll.name, scene.name, view_layer.name, source)
+    if use_cache and key in _antenna_cache:
+        return _antenna_cache[key]
+
+    if source == 'VERTICES':
+        positions = _vertex_positions(coll, _get_evaluated_depsgraph(context, scene, view_layer))
+    elif source == 'INSTANCES':
+        positions = _instance_positions(coll, _get_evaluated_depsgraph(context, scene, view_layer))
+    elif scene == context.scene:
+        positions = _object_positions(coll)
+    else:
+        positions = _object_positions(coll, _get_evaluated_depsgraph(context, scene, view_layer))
+
+    _antenna_cache[key] = positions
+    return positions
+
+"""
+Antenna positions of several scenes, as a dictionary of scene name to positions.
+Each scene is evaluated through its own view layer,
+returns an empty dictionary if the antenna collection is missing.
+"""
+def find_scene_antennas(context, scenes, op=None, use_cache=False):
+    antennas = {}
+    for scene in scenes:
+        positions = find_antennas(context, op=op, use_cache=use_cache, scene=scene)
+        if positions is None:
+            return {}
+        antennas[scene.name] = positions
+    return antennas
+
+"""
+Directory of the visibility store for a scene, next to the .blend file.
+Unsaved files use the temporary directory instead.
+"""
+def get_visibility_store_path(scene):
+    if bpy.data.filepath:
+        dirpath = os.path.dirname(bpy.path.abspath(bpy.data.filepath))
+        basename = bpy.path.display_name_from_filepath(bpy.data.filepath)
+    else:
+        dirpath = bpy.app.tempdir
+        basename = "untitled"
+    return os.path.join(dirpath, "{}_{}.visibilities".format(basename, bpy.path.clean_name(scene.name)))
+
+"""
+Directory of the baked observation cache for a scene, next to the .blend file.
+"""
+def get_bake_cache_path(scene):
+    return os.path.splitext(get_visibility_store_path(scene))[0] + ".bake"
+
+"""
+Evaluate an animated property of an ID datablock for an array of frames.
+Returns the default value for all frames if the property is not animated.
+"""
+def evaluate_animated_property(id_data, data_path, index, frames, default):
+    animation_data = id_data.animation_data
+    action = animation_data.action if animation_data else None
+    fcurve = action.fcurves.find(data_path, index=index) if action else None
+    if fcurve is None:
+        return np.full(len(frames), default, dtype=np.float64)
+    return np.array([fcurve.evaluate(frame) for frame in frames], dtype=np.float64)
+
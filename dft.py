@@ -0,0 +1,100 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Direct Fourier transform imaging from exact uv positions, as ground truth for the gridded FFT images.
+# Work is split into chunks of pixels x samples that are evaluated on a thread pool, numpy releases the GIL.
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+
+default_chunk_samples = 2048
+default_chunk_pixels = 256
+
+def _sample_chunks(num_samples, chunk_samples):
+    return [(a, min(a + chunk_samples, num_samples)) for a in range(0, num_samples, chunk_samples)]
+
+def _window_chunk(u, v, values, l, m):
+    # The phase is separable on a regular pixel grid: exp(2 pi i (u l + v m)) = exp(2 pi i u l) * exp(2 pi i v m)
+    el = np.exp(2j * np.pi * np.outer(u, l))
+    em = np.exp(2j * np.pi * np.outer(v, m)) * values[:, None]
+    return em.T @ el
+
+"""
+Direct Fourier transform on a regular window of pixels with coordinates l (columns) and m (rows).
+Each sample is combined with its mirrored conjugate, so the result is the real-valued image of shape (len(m), len(l)).
+"""
+def dft_window(u, v, values, l, m, chunk_samples=default_chunk_samples, num_threads=None):
+    values = np.broadcast_to(np.asarray(values, dtype=np.complex128), np.shape(u))
+    chunks = _sample_chunks(len(u), chunk_samples)
+    with ThreadPoolExecutor(max_workers=num_threads or os.cpu_count()) as executor:
+        futures = [executor.submit(_window_chunk, u[a:b], v[a:b], values[a:b], l, m) for a, b in chunks]
+        image = np.zeros((len(m), len(l)), dtype=np.complex128)
+        for future in futures:
+            image += future.result()
+    return 2.0 * image.real
+
+def _points_chunk(u, v, values, l, m, chunk_samples):
+    result = np.zeros(len(l))
+    for a, b in _sample_chunks(len(u), chunk_samples):
+        phase = 2.0 * np.pi * (np.outer(l, u[a:b]) + np.outer(m, v[a:b]))
+        result += np.cos(phase) @ values[a:b].real - np.sin(phase) @ values[a:b].imag
+    return result
+
+"""
+Direct Fourier transform at arbitrary pixel coordinates l and m.
+Each sample is combined with its mirrored conjugate, so the result is real-valued.
+"""
+def dft_points(u, v, values, l, m, chunk_pixels=default_chunk_pixels, chunk_samples=default_chunk_samples, num_threads=None):
+    values = np.broadcast_to(np.asarray(values, dtype=np.complex128), np.shape(u))
+    l = np.ravel(l)
+    m = np.ravel(m)
+    result = np.zeros(len(l))
+    with ThreadPoolExecutor(max_workers=num_threads or os.cpu_count()) as executor:
+        futures = {a: executor.submit(_points_chunk, u, v, values, l[a:b], m[a:b], chunk_samples)
+                   for a, b in _sample_chunks(len(l), chunk_pixels)}
+        for a, future in futures.items():
+            chunk = future.result()
+            result[a:a + len(chunk)] = chunk
+    return 2.0 * result
+
+"""
+Pixel coordinates of a sub-window of the FFT image.
+The FFT image of width x height pixels with uv grid scale (pixels per uv unit) has the origin at pixel (width // 2, height // 2).
+Returns the l and m coordinates of the columns x0..x1 and rows y0..y1.
+"""
+def window_coordinates(width, height, scale, x0, x1, y0, y1):
+    l = (np.arange(x0, x1) - width // 2) * scale / width
+    m = (np.arange(y0, y1) - height // 2) * scale / height
+    return l, m
+
+"""
+Maximum and RMS difference between a gridded image and its exact direct transform.
+"""
+def compare_images(gridded, exact):
+    diff = np.asarray(gridded) - np.asarray(exact)
+    return float(np.max(np.abs(diff))), float(np.sqrt(np.mean(diff * diff)))
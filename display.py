@@ -0,0 +1,132 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Preview refresh management for the result images.
+# Preview icons are only visible where the interferometry panel draws them. Pixel updates mark previews as stale,
+# visible previews are regenerated at most once per preview_interval, hidden ones when they are drawn again.
+
+import bpy
+from bpy.app.handlers import persistent
+from functools import partial
+import time
+
+# Seconds after the last draw during which a preview counts as visible
+visibility_timeout = 2.0
+# Minimum time in seconds between preview regenerations of an image
+preview_interval = 0.5
+
+icon_size = (16, 16)
+icon_numpixels = icon_size[0] * icon_size[1]
+icon_pixels = [127, 127, 127, 255] * icon_numpixels
+icon_pixels_float = [0.5, 0.5, 0.5, 1.0] * icon_numpixels
+
+# Image name -> time of the last draw of its preview
+_last_drawn = {}
+# Image name -> time of the last preview regeneration
+_last_reload = {}
+# Images whose pixels changed since their preview was regenerated
+_stale = set()
+# Images with a preview job that may still be running
+_rendering = set()
+# Image name -> registered refresh timer
+_timers = {}
+
+def is_preview_visible(name):
+    return time.monotonic() - _last_drawn.get(name, -visibility_timeout) < visibility_timeout
+
+"""
+Record that the preview of an image is drawn, refreshes it if it was updated while hidden.
+Called from panel drawing.
+"""
+def mark_drawn(name):
+    _last_drawn[name] = time.monotonic()
+    # Drawing an icon without a valid preview starts a preview job
+    _rendering.add(name)
+    if name in _stale:
+        _schedule_refresh(name)
+
+"""
+Prepare an image for writing pixels.
+XXX Workaround for Blender bug: Icon preview job creates a race condition vs. pixel updates:
+https://developer.blender.org/T77571
+Overriding the icon is only needed while a preview job may be running.
+"""
+def begin_pixel_update(image):
+    if image.name in _rendering:
+        _rendering.discard(image.name)
+        image.preview.icon_size = icon_size
+        image.preview.icon_pixels = icon_pixels
+        image.preview.icon_pixels_float = icon_pixels_float
+
+"""
+Mark the preview of an image as stale after writing pixels.
+"""
+def end_pixel_update(image):
+    _stale.add(image.name)
+    if is_preview_visible(image.name):
+        _schedule_refresh(image.name)
+
+def _schedule_refresh(name):
+    timer = _timers.get(name)
+    if timer is not None and bpy.app.timers.is_registered(timer):
+        return
+    delay = max(_last_reload.get(name, -preview_interval) + preview_interval - time.monotonic(), 0.0)
+    timer = partial(_refresh_preview, name)
+    _timers[name] = timer
+    bpy.app.timers.register(timer, first_interval=delay, persistent=True)
+
+def _refresh_preview(name):
+    _timers.pop(name, None)
+    image = bpy.data.images.get(name)
+    # Hidden previews stay stale until they are drawn again
+    if image is None or name not in _stale or not is_preview_visible(name):
+        return None
+    _stale.discard(name)
+    image.preview.reload()
+    _last_reload[name] = time.monotonic()
+    _rendering.add(name)
+    return None
+
+def _clear():
+    for timer in _timers.values():
+        if bpy.app.timers.is_registered(timer):
+            bpy.app.timers.unregister(timer)
+    _timers.clear()
+    _stale.clear()
+    _rendering.clear()
+    _last_drawn.clear()
+    _last_reload.clear()
+
+"""
+Image names are reused by the next file, refresh state of the previous file is dropped.
+"""
+@persistent
+def load_handler(scene):
+    _clear()
+
+def shutdown():
+    _clear()
@@ -0,0 +1,203 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Export of raw float image arrays to FITS or NPY files on a background writer thread.
+# FITS files are written directly, there is no dependency on astropy.
+
+import os
+import threading
+import numpy as np
+
+export_format_items = [
+    ('FITS', "FITS", "Flexible Image Transport System file with WCS header"),
+    ('NPY', "NPY", "Numpy array file"),
+]
+
+fits_block_size = 2880
+fits_card_size = 80
+
+def _fits_card(key, value=None, comment=None):
+    if value is None:
+        card = key
+    else:
+        if isinstance(value, bool):
+            text = "T" if value else "F"
+        elif isinstance(value, str):
+            text = "'{:8}'".format(value.replace("'", "''"))
+        elif isinstance(value, float):
+            text = "{:.15G}".format(value)
+        else:
+            text = str(value)
+        card = "{:8}= {:>20}".format(key, text)
+        if comment:
+            card += " / " + comment
+    return card[:fits_card_size].ljust(fits_card_size)
+
+"""
+Write a 2D array as primary HDU of a FITS file.
+cards is a list of (key, value, comment) tuples added to the header, e.g. WCS keywords.
+"""
+def write_fits(filepath, array, cards=()):
+    data = np.asarray(array, dtype='>f4')
+    assert(data.ndim == 2)
+    height, width = data.shape
+
+    header = [
+        _fits_card("SIMPLE", True, "conforms to FITS standard"),
+        _fits_card("BITPIX", -32, "32-bit floating point"),
+        _fits_card("NAXIS", 2),
+        _fits_card("NAXIS1", width),
+        _fits_card("NAXIS2", height),
+    ]
+    header += [_fits_card(*card) for card in cards]
+    header.append(_fits_card("END"))
+    text = "".join(header)
+    text += " " * (-len(text) % fits_block_size)
+
+    raw = data.tobytes()
+    with open(filepath, 'wb') as f:
+        f.write(text.encode('ascii'))
+        f.write(raw)
+        f.write(b"\0" * (-len(raw) % fits_block_size))
+
+"""
+WCS header cards for an image plane with a sine projection centered on the target.
+target is (right ascension, declination) in radians, cell size in radians per pixel.
+"""
+def image_wcs_cards(width, height, target, cell_size, frequency):
+    return [
+        ("CTYPE1", "RA---SIN"),
+        ("CTYPE2", "DEC--SIN"),
+        ("CRPIX1", float(width // 2 + 1)),
+        ("CRPIX2", float(height // 2 + 1)),
+        ("CRVAL1", float(np.degrees(target[0]) % 360.0)),
+        ("CRVAL2", float(np.degrees(target[1]))),
+        ("CDELT1", float(-np.degrees(cell_size[0]))),
+        ("CDELT2", float(np.degrees(cell_size[1]))),
+        ("CUNIT1", "deg"),
+        ("CUNIT2", "deg"),
+        ("RESTFRQ", float(frequency), "Hz"),
+    ]
+
+"""
+WCS header cards for a uv plane grid, cell size in wavelengths per pixel.
+"""
+def uv_wcs_cards(width, height, cell_size, frequency):
+    return [
+        ("CTYPE1", "UU"),
+        ("CTYPE2", "VV"),
+        ("CRPIX1", float(width // 2 + 1)),
+        ("CRPIX2", float(height // 2 + 1)),
+        ("CRVAL1", 0.0),
+        ("CRVAL2", 0.0),
+        ("CDELT1", float(cell_size)),
+        ("CDELT2", float(cell_size)),
+        ("CUNIT1", "lambda"),
+        ("CUNIT2", "lambda"),
+        ("RESTFRQ", float(frequency), "Hz"),
+    ]
+
+def write_array(filepath, array, format, cards=()):
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    if format == 'FITS':
+        write_fits(filepath, np.real(array), cards)
+    else:
+        np.save(filepath, array)
+
+"""
+Background thread that writes export jobs.
+Jobs are keyed by file path: a newer job for the same file replaces a pending one, so the writer never falls behind.
+"""
+class ExportWriter:
+    def __init__(self):
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._running = True
+        self.errors = []
+        self._thread = threading.Thread(target=self._run, name="ObservatoryExport", daemon=True)
+        self._thread.start()
+
+    def submit(self, filepath, array, format, cards=()):
+        with self._condition:
+            self._pending[filepath] = (array, format, cards)
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and not self._pending:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                filepath, job = self._pending.popitem()
+            # Any failure only affects this job, the writer keeps running
+            try:
+                write_array(filepath, *job)
+            except Exception as err:
+                with self._condition:
+                    self.errors.append("{}: {}".format(filepath, err))
+
+    """
+    Return and clear error messages of failed jobs.
+    """
+    def take_errors(self):
+        with self._condition:
+            errors = self.errors
+            self.errors = []
+        return errors
+
+    """
+    Stop the writer thread after all pending jobs are written.
+    """
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+
+
+_writer = None
+
+def get_writer():
+    global _writer
+    if _writer is None:
+        _writer = ExportWriter()
+    return _writer
+
+"""
+Error messages of failed exports since the last call.
+"""
+def take_export_errors():
+    if _writer is None:
+        return []
+    return _writer.take_errors()
+
+def shutdown():
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
@@ -0,0 +1,83 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Baked celestial grid overlay.
+# Grids that are fixed relative to the stars are rasterized into an equirectangular texture in equatorial coordinates,
+# so the world shader only needs a single rotated texture lookup instead of per-pixel frame conversions.
+
+import numpy as np
+from .coordinates import equatorial_to_frame
+
+# Spacing of meridians and parallels
+default_longitude_spacing = np.radians(15.0)
+default_latitude_spacing = np.radians(10.0)
+
+"""
+Antialiased coverage of grid lines for arrays of frame coordinates.
+Distances to the nearest meridian and parallel are measured as angles on the sphere,
+lines have the given angular width and are at least one pixel wide.
+"""
+def grid_line_coverage(longitude, latitude, line_width, pixel_size,
+                       longitude_spacing=default_longitude_spacing, latitude_spacing=default_latitude_spacing):
+    d_lon = np.abs(np.mod(longitude + 0.5 * longitude_spacing, longitude_spacing) - 0.5 * longitude_spacing) * np.cos(latitude)
+    d_lat = np.abs(np.mod(latitude + 0.5 * latitude_spacing, latitude_spacing) - 0.5 * latitude_spacing)
+    distance = np.minimum(d_lon, d_lat)
+    half_width = 0.5 * max(line_width, pixel_size)
+    return np.clip(0.5 + (half_width - distance) / pixel_size, 0.0, 1.0)
+
+"""
+Equatorial coordinates of the pixel centers of an equirectangular texture.
+Right ascension increases with the column, declination with the row (row 0 at the south pole).
+"""
+def texture_coordinates(width, height):
+    ra = 2.0 * np.pi * (np.arange(width) + 0.5) / width
+    dec = np.pi * ((np.arange(height) + 0.5) / height - 0.5)
+    return np.meshgrid(ra, dec)
+
+"""
+Rasterize grids into flat RGBA float32 pixels of a (height, width) equirectangular texture.
+grids is a sequence of (matrix, color) pairs, where matrix rotates equatorial coordinates into the grid frame.
+Grids are composited in order, the result has straight (not premultiplied) alpha.
+"""
+def bake_grid_overlay(width, height, grids, line_width):
+    ra, dec = texture_coordinates(width, height)
+    pixel_size = np.pi / height
+    color = np.zeros((height, width, 3), dtype=np.float32)
+    alpha = np.zeros((height, width), dtype=np.float32)
+    for matrix, grid_color in grids:
+        longitude, latitude = equatorial_to_frame(ra, dec, matrix)
+        coverage = grid_line_coverage(longitude, latitude, line_width, pixel_size).astype(np.float32)
+        # Premultiplied "over" compositing
+        color *= (1.0 - coverage)[..., None]
+        color += coverage[..., None] * np.asarray(grid_color[:3], dtype=np.float32)
+        alpha = coverage + alpha * (1.0 - coverage)
+
+    rgba = np.empty((height, width, 4), dtype=np.float32)
+    np.divide(color, alpha[..., None], out=rgba[..., :3], where=alpha[..., None] > 0.0)
+    rgba[..., :3][alpha <= 0.0] = 0.0
+    rgba[..., 3] = alpha
+    return rgba.ravel()
@@ -0,0 +1,107 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Imaging kernels that only depend on numpy, so they can also run in worker processes outside of Blender.
+
+import numpy as np
+from numpy import fft as fft
+from .shared_buffers import write_grey_slab
+from .weighting import uv_pixel_indices
+
+"""
+Convert antenna locations (an array or sequence of vectors) into an (N, 3) array.
+"""
+def antenna_positions(antennas):
+    return np.asarray(antennas, dtype=np.float64).reshape(-1, 3)
+
+"""
+Antenna index pairs (i, j) with i < j, in the order used for baseline indices.
+"""
+def baseline_pairs(num_antennas):
+    return np.triu_indices(num_antennas, k=1)
+
+"""
+Baseline vectors b - a for all antenna pairs, as an (M, 3) array.
+"""
+def compute_baselines(positions):
+    i, j = baseline_pairs(len(positions))
+    return positions[j] - positions[i]
+
+"""
+Accumulate samples into a complex uv grid of shape (h, w).
+u and v are sample coordinates, scale converts them to pixels.
+If mirror is True each sample is also added at the mirrored position with conjugate value so that the image is real-valued.
+"""
+def grid_samples(grid, u, v, values, scale, mirror=True):
+    h, w = grid.shape
+    values = np.broadcast_to(np.asarray(values, dtype=np.complex128), np.shape(u))
+    signs = ((1.0, values), (-1.0, np.conj(values))) if mirror else ((1.0, values),)
+    for sign, vals in signs:
+        index, mask = uv_pixel_indices(u, v, w, h, scale, sign)
+        index = index[mask]
+        vals = vals[mask]
+        flat = np.bincount(index, weights=vals.real, minlength=w * h) + 1j * np.bincount(index, weights=vals.imag, minlength=w * h)
+        grid += flat.reshape(h, w).astype(grid.dtype)
+
+"""
+Rotate baselines into the target frame for each of a sequence of rotation matrices.
+Returns an array of shape (T, M, 3) for T rotations and M baselines.
+"""
+def rotate_baselines(baselines, rotations):
+    # Inverse (transposed) target rotation applied to each baseline
+    return np.einsum('tji,bj->tbi', rotations, baselines)
+
+"""
+Normalized sampling image and point spread function for a weighted sampling grid.
+The point spread function is scaled to a peak value of 1.
+"""
+def sampling_to_images(sampling):
+    h, w = sampling.shape
+    total_weight = np.sum(sampling.real)
+    max_weight = np.max(sampling.real)
+    if total_weight <= 0.0 or max_weight <= 0.0:
+        return sampling.real, np.zeros(sampling.shape)
+
+    fftin = fft.ifftshift(sampling)
+    fftout = fft.ifft2(fftin)
+    pointspread = fft.fftshift(fftout) * (w * h) / total_weight
+    return sampling.real / max_weight, pointspread
+
+"""
+Worker: grid weighted samples and write the sampling and point spread images into shared memory slabs.
+Returns False if the samples have no weight.
+"""
+def render_sampling_slabs(u, v, weights, width, height, scale, sampling_descriptor, pointspread_descriptor):
+    sampling = np.zeros((height, width), dtype=np.complex128)
+    grid_samples(sampling, u, v, weights, scale)
+    max_weight = np.max(sampling.real)
+    if max_weight <= 0.0:
+        return False
+    _, pointspread = sampling_to_images(sampling)
+    write_grey_slab(sampling_descriptor, sampling.real, norm=max_weight)
+    write_grey_slab(pointspread_descriptor, np.real(pointspread))
+    return True
@@ -0,0 +1,98 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Linear mosaicking of multiple pointings around the target.
+# Each pointing sees the sky attenuated by its primary beam, pointings are imaged independently
+# at their own phase centre in worker processes, reprojected onto the mosaic grid around the target
+# and combined weighted by their beams.
+
+import numpy as np
+from numpy import fft as fft
+from .catalog import predict_visibilities
+from .gridding import grid_samples
+
+"""
+Direction cosine offsets (l, m) of a square grid of size x size pointings centered on the target.
+"""
+def pointing_offsets(size, spacing):
+    t = (np.arange(size) - 0.5 * (size - 1)) * spacing
+    l, m = np.meshgrid(t, t)
+    return np.stack((l.ravel(), m.ravel()), axis=1)
+
+"""
+Shift an image by (dx, dy) pixels with bilinear interpolation, pixels shifted in from outside the image are zero.
+"""
+def shift_image(image, dx, dy):
+    h, w = image.shape
+    x = np.arange(w) - dx
+    y = np.arange(h) - dy
+    x0 = np.floor(x).astype(np.int64)
+    y0 = np.floor(y).astype(np.int64)
+    fx = (x - x0)[None, :]
+    fy = (y - y0)[:, None]
+    # One pixel of zero padding, indices further outside are clamped onto the padding
+    padded = np.pad(image, 1)
+    def sample(yi, xi):
+        return padded[np.clip(yi + 1, 0, h + 1)[:, None], np.clip(xi + 1, 0, w + 1)[None, :]]
+    return ((1.0 - fy) * ((1.0 - fx) * sample(y0, x0) + fx * sample(y0, x0 + 1))
+            + fy * ((1.0 - fx) * sample(y0 + 1, x0) + fx * sample(y0 + 1, x0 + 1)))
+
+"""
+Worker: dirty image of point sources with beam-attenuated fluxes for a pointing at offset (l0, m0) from the target.
+u, v are sample coordinates in wavelengths with imaging weights, sources are given by direction cosines relative to the target.
+The pointing is imaged at its own phase centre and reprojected onto the image grid centered on the target.
+The image is normalized so that a unit point source at the phase centre has a peak of 1.
+"""
+def image_pointing(u, v, weights, l, m, n_minus_1, flux, width, height, scale, l0=0.0, m0=0.0):
+    # Source coordinates relative to the phase centre of the pointing
+    vis = predict_visibilities(u, v, np.zeros_like(u), l - l0, m - m0, n_minus_1, flux)
+    sampling = np.zeros((height, width), dtype=np.complex128)
+    grid = np.zeros((height, width), dtype=np.complex128)
+    grid_samples(sampling, u, v, weights, scale)
+    grid_samples(grid, u, v, weights * vis, scale)
+    total_weight = np.sum(sampling.real)
+    if total_weight <= 0.0:
+        return np.zeros((height, width), dtype=np.float32)
+    image = fft.fftshift(fft.ifft2(fft.ifftshift(grid))) * (width * height) / total_weight
+    # Pixel size is scale / width in l and scale / height in m
+    image = shift_image(np.real(image), l0 * width / scale, m0 * height / scale)
+    return image.astype(np.float32)
+
+"""
+Combine pointing images with their primary beams: sum(A_p I_p) / sum(A_p^2).
+Pixels where the summed beam power drops below cutoff^2 of its maximum are set to zero.
+Returns the mosaic and the summed beam power (relative sensitivity).
+"""
+def linear_mosaic(images, beams, cutoff=0.1):
+    numerator = np.zeros(np.shape(images[0]), dtype=np.float64)
+    weight = np.zeros(np.shape(images[0]), dtype=np.float64)
+    for image, beam in zip(images, beams):
+        numerator += beam * image
+        weight += beam * beam
+    threshold = cutoff * cutoff * np.max(weight)
+    mosaic = np.divide(numerator, weight, out=np.zeros_like(numerator), where=weight > threshold)
+    return mosaic, weight
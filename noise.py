@@ -0,0 +1,166 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Thermal noise Monte Carlo for sensitivity estimates.
+# Gridding is linear, so the noise of all samples falling onto the same pair of grid pixels
+# (the sample and its mirrored conjugate) is a single complex gaussian with the summed variance.
+# Realizations only draw one value per occupied pixel pair, independent of the number of samples,
+# and are imaged with batched FFTs over stacks of (R, H, W) grids.
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+from numpy import fft as fft
+from .constants import c
+from .weighting import uv_pixel_indices
+
+# Boltzmann constant in J/K
+k_B = 1.380649e-23
+# Jansky in W m^-2 Hz^-1
+jansky = 1.0e-26
+
+"""
+Galactic sky brightness temperature in K, dominant at low frequencies.
+"""
+def sky_temperature(frequency):
+    return 60.0 * (c / np.asarray(frequency, dtype=np.float64))**2.55
+
+"""
+Visibility noise in Jy per real and imaginary component from the radiometer equation.
+tsys is the system temperature of each antenna in K (scalar or broadcastable array),
+pairs are the antenna indices of baselines, if given the result is per baseline.
+"""
+def baseline_sigma(tsys, dish_diameter, efficiency, bandwidth, integration_time, pairs=None):
+    area = efficiency * np.pi * (0.5 * dish_diameter)**2
+    sefd = 2.0 * k_B * np.asarray(tsys, dtype=np.float64) / area / jansky
+    if pairs is not None:
+        sefd = np.sqrt(sefd[pairs[0]] * sefd[pairs[1]])
+    return sefd / np.sqrt(2.0 * bandwidth * integration_time)
+
+"""
+Accumulates per pixel pair noise variances of weighted samples on a (h, w) grid.
+"""
+class NoiseGrid:
+    def __init__(self, w, h, scale):
+        self.w = w
+        self.h = h
+        self.scale = scale
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.variance = np.zeros(0, dtype=np.float64)
+        # Sum of gridded weights, normalizes images to a peak response of 1 for a unit point source
+        self.norm = 0.0
+
+    """
+    Add samples with imaging weights and noise sigma per component.
+    """
+    def add_samples(self, u, v, weights, sigma):
+        w, h = self.w, self.h
+        weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), np.shape(u))
+        variance = weights**2 * np.broadcast_to(np.asarray(sigma, dtype=np.float64), np.shape(u))**2
+        index, mask = uv_pixel_indices(u, v, w, h, self.scale, 1.0)
+        mirror, mirror_mask = uv_pixel_indices(u, v, w, h, self.scale, -1.0)
+        self.norm += np.sum(weights[mask]) + np.sum(weights[mirror_mask])
+
+        # Pixels outside the grid map to the sentinel index w * h
+        outside = w * h
+        keys = np.where(mask, index, outside) * (outside + 1) + np.where(mirror_mask, mirror, outside)
+        inside = mask | mirror_mask
+        keys = np.concatenate((self.keys, keys[inside]))
+        variance = np.concatenate((self.variance, variance[inside]))
+        self.keys, inverse = np.unique(keys, return_inverse=True)
+        self.variance = np.bincount(inverse.reshape(-1), weights=variance)
+
+    def pixel_pairs(self):
+        outside = self.w * self.h
+        return self.keys // (outside + 1), self.keys % (outside + 1)
+
+def _image_stack(grids, begin, end):
+    grids[begin:end] = fft.fftshift(fft.ifft2(fft.ifftshift(grids[begin:end], axes=(1, 2))), axes=(1, 2))
+
+"""
+Per pixel noise statistics of num_realizations dirty images of thermal noise.
+Realizations are processed in batches bounded by max_chunk_bytes of grid memory,
+the FFTs of a batch are split over threads (numpy releases the GIL in FFTs).
+Returns the mean and standard deviation images and the RMS over all pixels and realizations.
+"""
+def noise_statistics(noise_grid, num_realizations, max_chunk_bytes=1 << 28, num_threads=None, seed=None, progress=None):
+    w, h = noise_grid.w, noise_grid.h
+    size = w * h
+    total = np.zeros((h, w), dtype=np.float64)
+    total_sq = np.zeros((h, w), dtype=np.float64)
+    if noise_grid.norm <= 0.0 or num_realizations < 1:
+        return total, total_sq, 0.0
+
+    rng = np.random.default_rng(seed)
+    pixel, mirror = noise_grid.pixel_pairs()
+    stddev = np.sqrt(noise_grid.variance)
+    pixel_inside = pixel < size
+    mirror_inside = mirror < size
+
+    chunk = int(np.clip(max_chunk_bytes // (size * 16), 1, num_realizations))
+    num_threads = num_threads or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        for start in range(0, num_realizations, chunk):
+            count = min(chunk, num_realizations - start)
+            noise = stddev * (rng.standard_normal((count, len(stddev))) + 1j * rng.standard_normal((count, len(stddev))))
+
+            # Batched gridding of all realizations of the chunk with offset pixel indices
+            offset = (np.arange(count, dtype=np.int64) * size)[:, None]
+            grids = np.zeros(count * size, dtype=np.complex128)
+            for index, inside, values in ((pixel, pixel_inside, noise), (mirror, mirror_inside, np.conj(noise))):
+                keys = (offset + index[inside]).reshape(-1)
+                values = values[:, inside].reshape(-1)
+                grids += np.bincount(keys, weights=values.real, minlength=count * size)
+                grids += 1j * np.bincount(keys, weights=values.imag, minlength=count * size)
+            grids = grids.reshape(count, h, w)
+
+            step = -(-count // num_threads)
+            list(executor.map(lambda b: _image_stack(grids, b, min(b + step, count)), range(0, count, step)))
+            images = grids.real * (size / noise_grid.norm)
+            total += np.sum(images, axis=0)
+            total_sq += np.sum(images**2, axis=0)
+            del grids, images
+
+            if progress is not None:
+                progress((start + count) / num_realizations)
+
+    mean = total / num_realizations
+    variance = np.maximum(total_sq / num_realizations - mean**2, 0.0)
+    rms = np.sqrt(np.sum(total_sq) / (num_realizations * size))
+    return mean, np.sqrt(variance), rms
+
+"""
+Expected image noise at the phase center, for natural weighting sigma / sqrt(N) for N samples.
+"""
+def expected_image_noise(noise_grid):
+    if noise_grid.norm <= 0.0:
+        return 0.0
+    pixel, mirror = noise_grid.pixel_pairs()
+    size = noise_grid.w * noise_grid.h
+    # The real part of each pair value is added once for every pixel of the pair on the grid
+    counts = (pixel < size).astype(np.float64) + (mirror < size)
+    return np.sqrt(np.sum(noise_grid.variance * counts**2)) / noise_grid.norm
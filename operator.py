@@ -27,7 +27,12 @@
 import bpy
 from bpy_types import Operator
 from bpy.props import BoolProperty, EnumProperty, FloatProperty, FloatVectorProperty
-from . import sampling, data_links
+from . import bake, calibration, coverage, export, sampling, data_links, workers
+from .coordinates import earth_rotation_angles, target_rotation_matrices
+from functools import partial
+import numpy as np
+import os
+import time
 
 
 class AddObservatorySettingsNodeGroupOperator(bpy.types.Operator):
@@ -87,7 +92,10 @@ class ComputeSamplingImageOperator(bpy.types.Operator):
         if antennas is None:
             return {'CANCELLED'}
 
-        if not sampling.compute_sampling_image(scene, antennas):
+        if not sampling.compute_sampling_image(scene, antennas, wait=True):
+            error = sampling.take_render_error(scene.name)
+            if error is not None:
+                self.report({'ERROR'}, "Sampling image render failed: {}".format(error))
             return {'CANCELLED'}
 
         sampling.execute_all_image_pixel_updates(scene)
@@ -95,12 +103,362 @@ class ComputeSamplingImageOperator(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class ComputeAllSamplingImagesOperator(bpy.types.Operator):
+    """Compute sampling images of all scenes, sharing antennas and baselines between scenes"""
+    bl_idname = "observatory.compute_all_sampling_images"
+    bl_label = "Compute All Sampling Images"
+
+    def execute(self, context):
+        scenes = [scene for scene in bpy.data.scenes if not scene.interferometry.use_baked_observation]
+
+        antennas = data_links.find_scene_antennas(context, scenes, op=self)
+        if not antennas:
+            return {'CANCELLED'}
+
+        start = time.perf_counter()
+        sampling.prune_scene_state(bpy.data.scenes.keys())
+        count = sampling.compute_scene_sampling_images(scenes, antennas, wait=True)
+        for scene in scenes:
+            error = sampling.take_render_error(scene.name)
+            if error is not None:
+                self.report({'WARNING'}, "Sampling image render of {} failed: {}".format(scene.name, error))
+        if count == 0:
+            return {'CANCELLED'}
+
+        for scene in scenes:
+            sampling.execute_all_image_pixel_updates(scene)
+
+        self.report({'INFO'}, "Computed images of {} scenes in {:.2f}s".format(count, time.perf_counter() - start))
+        return {'FINISHED'}
+
+
+class SimulateObservationOperator(bpy.types.Operator):
+    """Simulate an earth rotation observation and write the samples to the visibility store"""
+    bl_idname = "observatory.simulate_observation"
+    bl_label = "Simulate Observation"
+
+    def execute(self, context):
+        scene = context.scene
+        observatory = scene.observatory
+        interferometry = scene.interferometry
+
+        antennas = data_links.find_antennas(context, op=self)
+        if antennas is None:
+            return {'CANCELLED'}
+
+        sources = None
+        if interferometry.use_sky_model:
+            sources = interferometry.get_sky_model()
+            if sources is None:
+                self.report({'ERROR'}, "Source catalog not found")
+                return {'CANCELLED'}
+
+        store = interferometry.get_visibility_store()
+        sampling.simulate_observation(
+            store,
+            sampling.antenna_positions(antennas),
+            location=observatory.location.co[:],
+            target=interferometry.target.co[:],
+            day=observatory.time.day,
+            hour=observatory.time.hour,
+            duration=interferometry.observation_duration,
+            integration_time=interferometry.integration_time,
+            frequencies=interferometry.get_channel_frequencies(),
+            chunk_size=interferometry.store_chunk_size,
+            averaging_tolerance=interferometry.averaging_tolerance,
+            sources=sources,
+            )
+        self.report({'INFO'}, "Stored {} visibility samples".format(len(store)))
+        return {'FINISHED'}
+
+
+class QueryCatalogOperator(bpy.types.Operator):
+    """Load the source catalog and find the sources in the field of view around the target"""
+    bl_idname = "observatory.query_catalog"
+    bl_label = "Query Catalog"
+
+    def execute(self, context):
+        interferometry = context.scene.interferometry
+
+        try:
+            source_catalog = interferometry.get_catalog()
+        except (OSError, ValueError) as err:
+            self.report({'ERROR'}, "Could not load source catalog: {}".format(err))
+            return {'CANCELLED'}
+        if source_catalog is None:
+            self.report({'ERROR'}, "Source catalog not found")
+            return {'CANCELLED'}
+
+        start_time = time.perf_counter()
+        index = source_catalog.cone(*interferometry.target.co[:], interferometry.field_of_view)
+        query_time = time.perf_counter() - start_time
+
+        interferometry["catalog_query"] = {
+            "num_sources": len(source_catalog),
+            "num_field": len(index),
+            "total_flux": float(np.sum(source_catalog.flux[index])),
+            "query_time": query_time,
+        }
+        self.report({'INFO'}, "{} sources in field of view".format(len(index)))
+        return {'FINISHED'}
+
+
+class ComputeStoreImagesOperator(bpy.types.Operator):
+    """Compute sampling images from the stored visibilities of a simulated observation"""
+    bl_idname = "observatory.compute_store_images"
+    bl_label = "Image Stored Observation"
+
+    def execute(self, context):
+        scene = context.scene
+        interferometry = scene.interferometry
+
+        store = interferometry.get_visibility_store()
+        if len(store) == 0:
+            self.report({'ERROR'}, "No stored visibilities, simulate an observation first")
+            return {'CANCELLED'}
+
+        if not sampling.compute_store_images(scene, store, chunk_size=interferometry.store_chunk_size):
+            return {'CANCELLED'}
+
+        sampling.execute_all_image_pixel_updates(scene)
+
+        return {'FINISHED'}
+
+
+class SimulateNoiseOperator(bpy.types.Operator):
+    """Estimate image noise statistics from thermal noise realizations of the stored observation"""
+    bl_idname = "observatory.simulate_noise"
+    bl_label = "Simulate Noise"
+
+    def execute(self, context):
+        scene = context.scene
+        interferometry = scene.interferometry
+
+        store = interferometry.get_visibility_store()
+        if len(store) == 0:
+            self.report({'ERROR'}, "No stored visibilities, simulate an observation first")
+            return {'CANCELLED'}
+        if interferometry.channel_width <= 0.0:
+            self.report({'ERROR'}, "Channel width must be greater than zero")
+            return {'CANCELLED'}
+
+        wm = context.window_manager
+        wm.progress_begin(0.0, 1.0)
+        try:
+            stats = sampling.compute_noise_statistics(scene, store, chunk_size=interferometry.store_chunk_size,
+                                                      progress=wm.progress_update)
+        finally:
+            wm.progress_end()
+        if stats is None:
+            return {'CANCELLED'}
+
+        interferometry["noise"] = stats
+        self.report({'INFO'}, "Image noise: {:.3g} Jy".format(stats["rms"]))
+        return {'FINISHED'}
+
+
+class ComputeMosaicOperator(bpy.types.Operator):
+    """Image a grid of pointings around the target and combine them into a primary beam weighted mosaic"""
+    bl_idname = "observatory.compute_mosaic"
+    bl_label = "Compute Mosaic"
+
+    def execute(self, context):
+        scene = context.scene
+        interferometry = scene.interferometry
+
+        antennas = data_links.find_antennas(context, op=self)
+        if antennas is None:
+            return {'CANCELLED'}
+
+        sources = interferometry.get_sky_model() if interferometry.use_sky_model else None
+        stats = sampling.compute_mosaic_image(scene, antennas, sources=sources)
+        if stats is None:
+            return {'CANCELLED'}
+        sampling.execute_all_image_pixel_updates(scene)
+
+        interferometry["mosaic"] = stats
+        self.report({'INFO'}, "Mosaic of {} pointings in {:.2f} s".format(stats["num_pointings"], stats["time"]))
+        return {'FINISHED'}
+
+
+class AnalyzeCoverageOperator(bpy.types.Operator):
+    """Compute uv-coverage statistics of the current baselines"""
+    bl_idname = "observatory.analyze_coverage"
+    bl_label = "Analyze Coverage"
+
+    def execute(self, context):
+        interferometry = context.scene.interferometry
+
+        antennas = data_links.find_antennas(context, op=self)
+        if antennas is None:
+            return {'CANCELLED'}
+
+        baselines = sampling.compute_baselines(sampling.antenna_positions(antennas))
+        stats = coverage.analyze_coverage(baselines[:, :2], tolerance=interferometry.redundancy_tolerance)
+        if stats is None:
+            self.report({'ERROR'}, "At least two antennas are needed for coverage analysis")
+            return {'CANCELLED'}
+
+        # Stored as ID property for access in the UI and from scripts
+        interferometry["coverage"] = stats
+        return {'FINISHED'}
+
+
+class BakeObservationOperator(bpy.types.Operator):
+    """Bake cumulative sampling and point spread images for the frame range, for real-time playback"""
+    bl_idname = "observatory.bake_observation"
+    bl_label = "Bake Observation"
+
+    def execute(self, context):
+        scene = context.scene
+        observatory = scene.observatory
+        interferometry = scene.interferometry
+
+        antennas = data_links.find_antennas(context, op=self)
+        if antennas is None:
+            return {'CANCELLED'}
+        baselines, multiplicity = sampling.compute_unique_baselines(interferometry, antennas)
+
+        # Sidereal rotation table for all frames in one pass, from the animated time and coordinates
+        frames = np.arange(scene.frame_start, scene.frame_end + 1)
+        evaluate = partial(data_links.evaluate_animated_property, scene, frames=frames)
+        day = evaluate("observatory.time.day", 0, default=observatory.time.day)
+        hour = evaluate("observatory.time.hour", 0, default=observatory.time.hour)
+        location = [evaluate("observatory.location.co", i, default=observatory.location.co[i]) for i in range(2)]
+        target = [evaluate("interferometry.target.co", i, default=interferometry.target.co[i]) for i in range(2)]
+        rotations = target_rotation_matrices(location, target, earth_rotation_angles(day, hour))
+
+        wm = context.window_manager
+        wm.progress_begin(0.0, 1.0)
+        try:
+            cache = interferometry.get_bake_cache(reload=True)
+            baked = bake.bake_observation(
+                cache, baselines, rotations, scene.frame_start,
+                interferometry.image_width, interferometry.image_height,
+                executor=workers.get_process_pool(),
+                num_blocks=os.cpu_count(),
+                weighting_mode=interferometry.weighting,
+                robust=interferometry.robustness,
+                taper=interferometry.uv_taper,
+                weights=multiplicity,
+                progress=wm.progress_update,
+                )
+        finally:
+            wm.progress_end()
+        if not baked:
+            self.report({'ERROR'}, "Nothing to bake, at least two antennas and one frame are needed")
+            return {'CANCELLED'}
+
+        interferometry.use_baked_observation = True
+        sampling.show_baked_frame(scene, cache, scene.frame_current)
+        return {'FINISHED'}
+
+
+class ValidatePointSpreadOperator(bpy.types.Operator):
+    """Compare the gridded point spread function with an exact direct Fourier transform"""
+    bl_idname = "observatory.validate_pointspread"
+    bl_label = "Validate Point Spread"
+
+    def execute(self, context):
+        interferometry = context.scene.interferometry
+
+        antennas = data_links.find_antennas(context, op=self)
+        if antennas is None:
+            return {'CANCELLED'}
+
+        result = sampling.validate_pointspread(context.scene, antennas, interferometry.dft_window_size)
+        if result is None:
+            self.report({'ERROR'}, "At least two antennas are needed for validation")
+            return {'CANCELLED'}
+
+        interferometry["dft_validation"] = result
+        self.report({'INFO'}, "Gridding error: max {:.3g}, RMS {:.3g}".format(result["max_error"], result["rms_error"]))
+        return {'FINISHED'}
+
+
+class ExportImagesOperator(bpy.types.Operator):
+    """Export the raw float arrays of the last computed images"""
+    bl_idname = "observatory.export_images"
+    bl_label = "Export Images"
+
+    def execute(self, context):
+        for error in export.take_export_errors():
+            self.report({'WARNING'}, "Export failed: {}".format(error))
+        if not sampling.export_results(context.scene):
+            self.report({'ERROR'}, "No computed images to export")
+            return {'CANCELLED'}
+        return {'FINISHED'}
+
+
+class SimulateCalibrationOperator(bpy.types.Operator):
+    """Corrupt the simulated visibilities of the visibility store with antenna gain errors and solve for the gains with StefCal"""
+    bl_idname = "observatory.simulate_calibration"
+    bl_label = "Simulate Calibration"
+
+    def execute(self, context):
+        interferometry = context.scene.interferometry
+
+        store = interferometry.get_visibility_store()
+        if len(store) == 0:
+            self.report({'ERROR'}, "Visibility store is empty, simulate an observation first")
+            return {'CANCELLED'}
+        if store.num_antennas < 3:
+            self.report({'ERROR'}, "At least three antennas are needed for calibration")
+            return {'CANCELLED'}
+
+        gains = calibration.generate_gains(
+            store.num_antennas,
+            interferometry.calibration_slots,
+            amplitude_error=interferometry.gain_amplitude_error,
+            phase_error=interferometry.gain_phase_error,
+            )
+        result = calibration.calibrate_store(
+            store,
+            gains,
+            noise=interferometry.calibration_noise,
+            max_iterations=interferometry.calibration_max_iterations,
+            tolerance=interferometry.calibration_tolerance,
+            chunk_size=interferometry.store_chunk_size,
+            )
+        if result is None:
+            self.report({'ERROR'}, "Nothing to calibrate, the visibility store has no weighted samples")
+            return {'CANCELLED'}
+        solved, stats = result
+
+        interferometry["calibration"] = stats
+        self.report({'INFO'}, "Solved {} antennas x {} slots in {:.2f} s ({:.2f} s total)".format(
+            stats["num_antennas"], stats["num_slots"], stats["solve_time"], stats["total_time"]))
+        return {'FINISHED'}
+
+
 def register():
     bpy.utils.register_class(AddObservatorySettingsNodeGroupOperator)
     bpy.utils.register_class(DownloadSkyMapTexturesOperator)
     bpy.utils.register_class(ComputeSamplingImageOperator)
+    bpy.utils.register_class(ComputeAllSamplingImagesOperator)
+    bpy.utils.register_class(SimulateObservationOperator)
+    bpy.utils.register_class(QueryCatalogOperator)
+    bpy.utils.register_class(ComputeStoreImagesOperator)
+    bpy.utils.register_class(SimulateNoiseOperator)
+    bpy.utils.register_class(ComputeMosaicOperator)
+    bpy.utils.register_class(AnalyzeCoverageOperator)
+    bpy.utils.register_class(BakeObservationOperator)
+    bpy.utils.register_class(ValidatePointSpreadOperator)
+    bpy.utils.register_class(ExportImagesOperator)
+    bpy.utils.register_class(SimulateCalibrationOperator)
 
 def unregister():
     bpy.utils.unregister_class(AddObservatorySettingsNodeGroupOperator)
     bpy.utils.unregister_class(DownloadSkyMapTexturesOperator)
+    bpy.utils.unregister_class(ComputeAllSamplingImagesOperator)
     bpy.utils.unregister_class(ComputeSamplingImageOperator)
+    bpy.utils.unregister_class(SimulateObservationOperator)
+    bpy.utils.unregister_class(QueryCatalogOperator)
+    bpy.utils.unregister_class(ComputeStoreImagesOperator)
+    bpy.utils.unregister_class(SimulateNoiseOperator)
+    bpy.utils.unregister_class(ComputeMosaicOperator)
+    bpy.utils.unregister_class(AnalyzeCoverageOperator)
+    bpy.utils.unregister_class(BakeObservationOperator)
+    bpy.utils.unregister_class(ValidatePointSpreadOperator)
+    bpy.utils.unregister_class(ExportImagesOperator)
+    bpy.utils.unregister_class(SimulateCalibrationOperator)
@@ -30,20 +30,19 @@ from bpy.types import PropertyGroup
 from bpy.app.handlers import persistent
 from math import *
 from mathutils import Euler, Quaternion, Vector, Matrix
+import os
 import time
-from .coordinates import MakeCelestialCoordinate, horizontal_to_equatorial, equatorial_to_horizontal
-from . import data_links, sampling
+from .coordinates import MakeCelestialCoordinate, horizontal_to_equatorial, equatorial_to_horizontal, solar_to_sidereal, sidereal_to_solar
+from . import bake, catalog, data_links, display, export, sampling
+from .visibility_store import VisibilityStore
+from .weighting import weighting_items
+from .wstacking import imaging_mode_items
+from .export import export_format_items
+from .beam import beam_model_items
+from .constants import c
 from functools import partial
 
 
-# Speed of light
-c = 299792458.0
-
-# Length of sidereal day
-solar_to_sidereal = 366.24/365.24
-sidereal_to_solar = 365.24/366.24
-
-
 sky_background_items = [
     ('NONE', "None", "No background"),
     ('VISIBLE', "Visible", "Stars in the visible spectrum"),
@@ -51,7 +50,7 @@ sky_background_items = [
 
 
 def update_generic(data, context):
-    data_links.update_nodegroup(data.id_data, context)
+    data_links.request_nodegroup_update(data.id_data)
 
 def MakeGridSettings(def_enabled=False, def_color=(0.8, 0.8, 0.8)):
     class GridSettings(PropertyGroup):
@@ -155,6 +154,33 @@ class ObservatorySettings(bpy.types.PropertyGroup):
     ecliptic_grid : PointerProperty(type=EclipticGridSettings)
     galactic_grid : PointerProperty(type=GalacticGridSettings)
 
+    use_baked_grids : BoolProperty(
+        name="Bake Grids",
+        description="Draw equatorial, ecliptic and galactic grids from a baked equirectangular texture instead of computing them in the shader",
+        default=False,
+        update=update_generic,
+        )
+
+    grid_texture_size : IntProperty(
+        name="Texture Size",
+        description="Height of the baked grid texture in pixels, the width is twice the height",
+        default=1024,
+        min=16,
+        soft_max=8192,
+        update=update_generic,
+        )
+
+    grid_line_width : FloatProperty(
+        name="Line Width",
+        description="Angular width of baked grid lines",
+        default=radians(0.2),
+        min=0.0,
+        soft_max=radians(2.0),
+        subtype='ANGLE',
+        unit='ROTATION',
+        update=update_generic,
+        )
+
     def draw(self, context, layout):
         layout.prop(self, "sky_background")
         if bpy.ops.observatory.download_skymap_textures.poll():
@@ -168,13 +194,21 @@ class ObservatorySettings(bpy.types.PropertyGroup):
         self.ecliptic_grid.draw(context, layout, "Ecliptic Grid")
         self.galactic_grid.draw(context, layout, "Galactic Grid")
 
+        row = layout.row(align=True)
+        row.prop(self, "use_baked_grids")
+        row2 = row.row(align=True)
+        row2.enabled = self.use_baked_grids
+        row2.prop(self, "grid_texture_size", text="Size")
+        row2.prop(self, "grid_line_width", text="Width")
+
 
 sampling_id = "ObservatorySampling"
 pointspread_id = "PointSpread"
 trueimage_id = "TrueImage"
 dirtybeam_id = "DirtyBeam"
 cleanbeam_id = "CleanBeam"
-all_image_ids = [sampling_id, pointspread_id, trueimage_id, dirtybeam_id, cleanbeam_id]
+mosaic_id = "Mosaic"
+all_image_ids = [sampling_id, pointspread_id, trueimage_id, dirtybeam_id, cleanbeam_id, mosaic_id]
 default_frequency = 1.428e9
 
 """
@@ -185,8 +219,30 @@ def update_images_timer(scene):
         # Unregister the timer function
         return None
     sampling.execute_all_image_pixel_updates(scene)
+    for error in export.take_export_errors():
+        print("Observatory export failed: {}".format(error))
     return scene.interferometry.auto_generate_images_interval
 
+# Set while images are generated, evaluating other scenes can trigger depsgraph handlers again
+_generating_images = False
+
+"""
+Generate images of several scenes at once.
+Antenna positions are evaluated per scene and cached, baselines are shared by scenes with identical antennas,
+see sampling.compute_scene_sampling_images.
+"""
+def generate_scene_images(scenes, wait=False):
+    global _generating_images
+    if _generating_images:
+        return 0
+    _generating_images = True
+    try:
+        sampling.prune_scene_state(bpy.data.scenes.keys())
+        antennas = data_links.find_scene_antennas(bpy.context, scenes, use_cache=True)
+        return sampling.compute_scene_sampling_images(scenes, antennas, wait=wait)
+    finally:
+        _generating_images = False
+
 class InterferometrySettings(bpy.types.PropertyGroup):
     @property
     def observatory(self):
@@ -254,8 +310,18 @@ class InterferometrySettings(bpy.types.PropertyGroup):
         default=128,
         )
 
+    antenna_source : EnumProperty(
+        name="Antenna Source",
+        description="Elements of the Observatory collection that are used as antennas",
+        items=data_links.antenna_source_items,
+        default='OBJECTS',
+        update=lambda self, context: data_links.invalidate_antenna_cache(),
+        )
+
     def contains_image_dependency(self, updates):
         antennas = data_links.get_antenna_collection()
+        if antennas is None:
+            return False
         objects = set(antennas.objects)
         for u in updates:
             # XXX Workaround for Blender crash:
@@ -275,10 +341,7 @@ class InterferometrySettings(bpy.types.PropertyGroup):
         return False
 
     def generate_images(self):
-        antennas = data_links.find_antennas(bpy.context)
-        if antennas is None:
-            return
-        sampling.compute_sampling_image(self.id_data, antennas)
+        generate_scene_images([self.id_data])
 
     def auto_generate_images_update(self, context):
         if self.auto_generate_images:
@@ -293,6 +356,12 @@ class InterferometrySettings(bpy.types.PropertyGroup):
         update=auto_generate_images_update,
         )
 
+    use_scene_images : BoolProperty(
+        name="Scene Images",
+        description="Use separate images named after the scene, so scenes with different settings can be compared side by side",
+        default=False,
+        )
+
     auto_generate_images_interval : FloatProperty(
         name="Auto Update Interval",
         description="Interval for automatic image updates",
@@ -303,7 +372,282 @@ class InterferometrySettings(bpy.types.PropertyGroup):
         update=auto_generate_images_update,
         )
 
+    imaging_mode : EnumProperty(
+        name="Imaging Mode",
+        description="Method for computing images from the baselines",
+        items=imaging_mode_items,
+        default='FLAT',
+        )
+
+    weighting : EnumProperty(
+        name="Weighting",
+        description="Weighting scheme for visibility samples",
+        items=weighting_items,
+        default='NATURAL',
+        )
+
+    robustness : FloatProperty(
+        name="Robustness",
+        description="Briggs robustness parameter, from uniform (-2) to natural (2) weighting",
+        default=0.0,
+        min=-2.0,
+        max=2.0,
+        )
+
+    uv_taper : FloatProperty(
+        name="Taper",
+        description="Width of a Gaussian uv taper relative to the longest baseline, disabled if zero",
+        default=0.0,
+        min=0.0,
+        soft_max=2.0,
+        subtype='FACTOR',
+        )
+
+    redundancy_tolerance : FloatProperty(
+        name="Redundancy Tolerance",
+        description="Distance below which baselines are considered redundant and imaged once with their multiplicity as weight",
+        default=0.01,
+        min=0.0,
+        soft_min=1.0e-4,
+        unit='LENGTH',
+        )
+
+    dft_window_size : IntProperty(
+        name="Validation Window",
+        description="Size of the centered image window evaluated by the direct Fourier transform",
+        default=128,
+        min=1,
+        soft_max=512,
+        )
+
+    catalog_filepath : StringProperty(
+        name="Source Catalog",
+        description="CSV or NPY file with ra, dec (degrees) and flux (Jy) columns of point sources",
+        default="",
+        subtype='FILE_PATH',
+        )
+
+    field_of_view : FloatProperty(
+        name="Field of View",
+        description="Radius of the field around the target from which catalog sources are used",
+        default=radians(2.0),
+        min=0.0,
+        max=pi,
+        subtype='ANGLE',
+        unit='ROTATION',
+        )
+
+    use_sky_model : BoolProperty(
+        name="Use Sky Model",
+        description="Predict visibilities of catalog sources in the field of view when simulating observations",
+        default=False,
+        )
+
+    system_temperature : FloatProperty(
+        name="System Temperature",
+        description="Receiver temperature in K, the sky temperature at the channel frequency is added",
+        default=50.0,
+        min=0.0,
+        soft_max=500.0,
+        )
+
+    dish_diameter : FloatProperty(
+        name="Dish Diameter",
+        description="Diameter of the antenna dishes in meters",
+        default=15.0,
+        min=0.01,
+        soft_max=100.0,
+        subtype='DISTANCE',
+        )
+
+    aperture_efficiency : FloatProperty(
+        name="Aperture Efficiency",
+        description="Fraction of the dish area that is effectively collecting",
+        default=0.7,
+        min=0.01,
+        max=1.0,
+        subtype='FACTOR',
+        )
+
+    noise_realizations : IntProperty(
+        name="Realizations",
+        description="Number of thermal noise realizations for image noise statistics",
+        default=64,
+        min=1,
+        soft_max=1024,
+        )
+
+    beam_model : EnumProperty(
+        name="Beam Model",
+        description="Primary beam model of the antenna dishes",
+        items=beam_model_items,
+        default='AIRY',
+        )
+
+    mosaic_size : IntProperty(
+        name="Mosaic Size",
+        description="Number of pointings along each axis of the square mosaic grid around the target",
+        default=3,
+        min=1,
+        soft_max=9,
+        )
+
+    mosaic_spacing : FloatProperty(
+        name="Pointing Spacing",
+        description="Distance between mosaic pointings in units of the primary beam width",
+        default=0.7,
+        min=0.01,
+        soft_max=2.0,
+        )
+
+    gain_amplitude_error : FloatProperty(
+        name="Amplitude Error",
+        description="Relative scatter of simulated antenna gain amplitudes",
+        default=0.1,
+        min=0.0,
+        soft_max=1.0,
+        )
+
+    gain_phase_error : FloatProperty(
+        name="Phase Error",
+        description="Scatter of simulated antenna gain phases",
+        default=0.5,
+        min=0.0,
+        soft_max=pi,
+        subtype='ANGLE',
+        )
+
+    calibration_slots : IntProperty(
+        name="Slots",
+        description="Number of time slots over the observation with independent gain solutions",
+        default=100,
+        min=1,
+        soft_max=10000,
+        )
+
+    calibration_noise : FloatProperty(
+        name="Noise",
+        description="Standard deviation of visibility noise relative to the point source flux",
+        default=0.01,
+        min=0.0,
+        soft_max=1.0,
+        )
+
+    calibration_max_iterations : IntProperty(
+        name="Max Iterations",
+        description="Maximum number of solver iterations",
+        default=100,
+        min=1,
+        )
+
+    calibration_tolerance : FloatProperty(
+        name="Tolerance",
+        description="Relative change of the gains below which a slot is converged",
+        default=1.0e-6,
+        min=0.0,
+        precision=8,
+        )
+
+    use_baked_observation : BoolProperty(
+        name="Use Baked Observation",
+        description="Show baked images of the frame range on frame changes instead of computing them",
+        default=False,
+        )
+
+    export_format : EnumProperty(
+        name="Export Format",
+        description="File format for exported image arrays",
+        items=export_format_items,
+        default='FITS',
+        )
+
+    export_directory : StringProperty(
+        name="Export Directory",
+        description="Directory for exported image arrays",
+        default="//export/",
+        subtype='DIR_PATH',
+        )
+
+    auto_export : BoolProperty(
+        name="Auto Export",
+        description="Export raw image arrays in the background whenever images are computed",
+        default=False,
+        )
+
+    def get_export_directory(self):
+        return bpy.path.abspath(self.export_directory)
+
+    observation_duration : FloatProperty(
+        name="Observation Duration",
+        description="Duration of simulated earth rotation observations in hours",
+        default=12.0,
+        min=0.0,
+        soft_max=24.0,
+        )
+
+    integration_time : FloatProperty(
+        name="Integration Time",
+        description="Time between samples of simulated observations in seconds",
+        default=60.0,
+        min=0.001,
+        soft_min=1.0,
+        soft_max=600.0,
+        )
+
+    num_channels : IntProperty(
+        name="Channels",
+        description="Number of frequency channels of simulated observations",
+        default=1,
+        min=1,
+        soft_max=1024,
+        )
+
+    channel_width : FloatProperty(
+        name="Channel Width",
+        description="Frequency width of each channel in Hz",
+        default=1.0e6,
+        min=0.0,
+        )
+
+    averaging_tolerance : FloatProperty(
+        name="Averaging Tolerance",
+        description="Maximum uv smearing in wavelengths for baseline-dependent averaging of simulated samples, disabled if zero",
+        default=0.0,
+        min=0.0,
+        soft_max=100.0,
+        )
+
+    store_chunk_size : IntProperty(
+        name="Chunk Size",
+        description="Number of visibility samples processed at once when reading or writing the visibility store",
+        default=1 << 20,
+        min=1024,
+        )
+
+    def get_channel_frequencies(self):
+        return [self.frequency + (i - 0.5 * (self.num_channels - 1)) * self.channel_width for i in range(self.num_channels)]
+
+    def get_visibility_store(self):
+        return VisibilityStore(data_links.get_visibility_store_path(self.id_data))
+
+    def get_catalog(self):
+        filepath = bpy.path.abspath(self.catalog_filepath)
+        if not self.catalog_filepath or not os.path.isfile(filepath):
+            return None
+        return catalog.get_catalog(filepath)
+
+    # Sources in the field of view around the target as (l, m, n - 1, flux)
+    def get_sky_model(self):
+        source_catalog = self.get_catalog()
+        if source_catalog is None:
+            return None
+        ra0, dec0 = self.target.co[:]
+        index = source_catalog.cone(ra0, dec0, self.field_of_view)
+        l, m, n_minus_1 = catalog.direction_cosines(source_catalog.ra[index], source_catalog.dec[index], ra0, dec0)
+        return l, m, n_minus_1, source_catalog.flux[index]
+
     def draw(self, context, layout):
+        layout.prop(self, "antenna_source")
         self.target.draw_long_lat(context, layout, label="Target")
 
         layout.separator()
@@ -323,16 +667,176 @@ class InterferometrySettings(bpy.types.PropertyGroup):
         row2.enabled = self.auto_generate_images
         row2.prop(self, "auto_generate_images_interval", text="Interval")
 
+        layout.prop(self, "imaging_mode")
+        row = layout.row(align=True)
+        row.prop(self, "weighting", text="")
+        row2 = row.row(align=True)
+        row2.enabled = (self.weighting == 'BRIGGS')
+        row2.prop(self, "robustness")
+        layout.prop(self, "uv_taper")
+
         layout.separator()
-        layout.operator("observatory.compute_sampling_image")
+        row = layout.row(align=True)
+        row.operator("observatory.compute_sampling_image")
+        row.operator("observatory.compute_all_sampling_images", text="All Scenes")
+        layout.prop(self, "use_scene_images")
+
+        self.draw_antenna(context, layout)
+        self.draw_mosaic(context, layout)
+        self.draw_coverage(context, layout)
+        self.draw_validation(context, layout)
+        self.draw_calibration(context, layout)
+
+        box = layout.box()
+        box.prop(self, "export_directory")
+        row = box.row(align=True)
+        row.prop(self, "export_format", text="")
+        row.prop(self, "auto_export")
+        row.operator("observatory.export_images", text="Export")
+
+        box = layout.box()
+        box.label(text="Observation:")
+        col = box.column(align=True)
+        col.prop(self, "observation_duration", text="Duration (h)")
+        col.prop(self, "integration_time", text="Integration (s)")
+        row = box.row(align=True)
+        row.prop(self, "num_channels")
+        row.prop(self, "channel_width", text="Width (Hz)")
+        box.prop(self, "averaging_tolerance")
+        box.prop(self, "store_chunk_size")
+        self.draw_catalog(context, box)
+        self.draw_noise(context, box)
+        row = box.row(align=True)
+        row.operator("observatory.simulate_observation")
+        row.operator("observatory.compute_store_images")
+
+        row = layout.row(align=True)
+        row.operator("observatory.bake_observation")
+        row.prop(self, "use_baked_observation", text="Use Bake")
 
         for image_id in all_image_ids:
-            img, data, prop = data_links.get_image_data_prop(image_id)
+            img, data, prop = data_links.get_image_data_prop(self.get_image_name(image_id))
             if data:
+                if img is not None:
+                    display.mark_drawn(img.name)
                 layout.template_ID_preview(data, prop)
 
+    def draw_catalog(self, context, layout):
+        layout.prop(self, "catalog_filepath")
+        row = layout.row(align=True)
+        row.prop(self, "field_of_view")
+        row.prop(self, "use_sky_model", text="Sky Model")
+        layout.operator("observatory.query_catalog")
+
+        result = self.get("catalog_query")
+        if result is None:
+            return
+        layout.label(text="{} of {} sources in field, {:.3g} Jy total ({:.2f} ms)".format(
+            result["num_field"], result["num_sources"], result["total_flux"], result["query_time"] * 1000.0))
+
+    def draw_noise(self, context, layout):
+        row = layout.row(align=True)
+        row.prop(self, "system_temperature", text="Tsys (K)")
+        row.prop(self, "noise_realizations")
+        layout.operator("observatory.simulate_noise")
+
+        stats = self.get("noise")
+        if stats is None:
+            return
+        col = layout.column(align=True)
+        col.label(text="Visibility noise: {:.3g} Jy".format(stats["visibility_sigma"]))
+        col.label(text="Image noise: {:.3g} Jy (expected {:.3g})".format(stats["rms"], stats["expected"]))
+        col.label(text="Pixel noise: {:.3g} - {:.3g} Jy".format(stats["min_stddev"], stats["max_stddev"]))
+        col.label(text="{} realizations in {:.2f} s".format(stats["realizations"], stats["time"]))
+
+    def draw_antenna(self, context, layout):
+        box = layout.box()
+        box.label(text="Antenna:")
+        row = box.row(align=True)
+        row.prop(self, "dish_diameter")
+        row.prop(self, "aperture_efficiency", text="Efficiency")
+        box.prop(self, "beam_model", text="")
+
+    def draw_mosaic(self, context, layout):
+        box = layout.box()
+        row = box.row(align=True)
+        row.prop(self, "mosaic_size")
+        row.prop(self, "mosaic_spacing", text="Spacing")
+        box.operator("observatory.compute_mosaic")
+
+        stats = self.get("mosaic")
+        if stats is None:
+            return
+        col = box.column(align=True)
+        col.label(text="Beam width: {:.3g} deg".format(degrees(stats["beam_width"])))
+        col.label(text="{} pointings in {:.2f} s".format(stats["num_pointings"], stats["time"]))
+
+    def draw_coverage(self, context, layout):
+        box = layout.box()
+        row = box.row(align=True)
+        row.operator("observatory.analyze_coverage")
+        row.prop(self, "redundancy_tolerance", text="Tolerance")
+
+        stats = self.get("coverage")
+        if stats is None:
+            return
+        col = box.column(align=True)
+        col.label(text="Baselines: {}  Unique: {}".format(stats["num_baselines"], stats["num_unique"]))
+        col.label(text="Redundancy: max {}  mean {:.2f}".format(stats["max_redundancy"], stats["mean_redundancy"]))
+        col.label(text="Baseline length: {:.3g} - {:.3g} m".format(stats["min_baseline"], stats["max_baseline"]))
+        col.label(text="Spacing: {:.3g} - {:.3g} m".format(stats["min_spacing"], stats["max_spacing"]))
+        for u, v, r in stats["holes"][:3]:
+            col.label(text="Hole: r={:.3g} m at ({:.3g}, {:.3g})".format(r, u, v))
+
+    def draw_validation(self, context, layout):
+        box = layout.box()
+        row = box.row(align=True)
+        row.operator("observatory.validate_pointspread")
+        row.prop(self, "dft_window_size", text="Window")
+
+        result = self.get("dft_validation")
+        if result is None:
+            return
+        col = box.column(align=True)
+        col.label(text="Max error: {:.3g}  RMS error: {:.3g}".format(result["max_error"], result["rms_error"]))
+        col.label(text="Window {}x{} in {:.2f} s".format(*result["window"], result["time"]))
+
+    def draw_calibration(self, context, layout):
+        box = layout.box()
+        row = box.row(align=True)
+        row.prop(self, "gain_amplitude_error")
+        row.prop(self, "gain_phase_error")
+        row = box.row(align=True)
+        row.prop(self, "calibration_slots")
+        row.prop(self, "calibration_noise")
+        row = box.row(align=True)
+        row.prop(self, "calibration_max_iterations")
+        row.prop(self, "calibration_tolerance")
+        box.operator("observatory.simulate_calibration")
+
+        stats = self.get("calibration")
+        if stats is None:
+            return
+        col = box.column(align=True)
+        col.label(text="Converged: {:.0%}  Iterations: mean {:.1f}, max {}".format(stats["converged"], stats["mean_iterations"], stats["max_iterations"]))
+        col.label(text="Gain RMS error: {:.3g}".format(stats["rms_error"]))
+        if stats.get("num_empty_slots", 0) > 0:
+            col.label(text="{} slots without samples".format(stats["num_empty_slots"]))
+        col.label(text="{} antennas x {} slots in {:.2f} s, {:.2f} s total".format(stats["num_antennas"], stats["num_slots"], stats["solve_time"], stats.get("total_time", stats["solve_time"])))
+
+    def get_bake_cache(self, reload=False):
+        return bake.get_cache(data_links.get_bake_cache_path(self.id_data), reload=reload)
+
+    """
+    Name of the image data block of an image id, scene images are suffixed with the scene name.
+    """
+    def get_image_name(self, image_id):
+        if self.use_scene_images:
+            return "{}.{}".format(image_id, self.id_data.name)
+        return image_id
+
     def get_image(self, name, create=False):
-        img, data, prop = data_links.get_image_data_prop(name, create=create, width=self.image_width, height=self.image_height)
+        img, data, prop = data_links.get_image_data_prop(self.get_image_name(name), create=create, width=self.image_width, height=self.image_height)
         return img
 
     def get_sampling_image(self, create=False):
@@ -350,25 +854,47 @@ class InterferometrySettings(bpy.types.PropertyGroup):
     def get_cleanbeam_image(self, create=False):
         return self.get_image(cleanbeam_id, create=create)
 
+    def get_mosaic_image(self, create=False):
+        return self.get_image(mosaic_id, create=create)
+
 
 @persistent
 def load_handler(scene):
+    # Images of the previous file are gone
+    sampling.prune_scene_state(())
     # Restart timers where needed
     for scene in bpy.data.scenes:
         scene.interferometry.auto_generate_images_update(bpy.context)
 
 @persistent
 def depsgraph_handler_pre(scene):
+    # Without a window (background mode, scripts) there are no auto updates,
+    # operators extract antennas without the cache.
+    if bpy.context.window is None:
+        return
+    # Warning: cannot use the evaluated depsgraph from context, this causes infinite loops!
+    depsgraph = bpy.context.window.view_layer.depsgraph
+    images_updated = scene.interferometry.contains_image_dependency(depsgraph.updates)
+    if images_updated:
+        data_links.invalidate_antenna_cache()
     if scene.interferometry.auto_generate_images:
-        # Warning: cannot use the evaluated depsgraph from context, this causes infinite loops!
-        depsgraph = bpy.context.window.view_layer.depsgraph
-        scene.interferometry["images_updated"] = scene.interferometry.contains_image_dependency(depsgraph.updates)
+        scene.interferometry["images_updated"] = images_updated
 
 @persistent
 def depsgraph_handler_post(scene):
-    if scene.interferometry.auto_generate_images:
+    if scene.interferometry.auto_generate_images and not scene.interferometry.use_baked_observation:
         if scene.interferometry.get("images_updated", False):
-            scene.interferometry.generate_images()
+            # Baselines are shared, update all scenes with automatic images together
+            generate_scene_images([s for s in bpy.data.scenes
+                                   if s.interferometry.auto_generate_images and not s.interferometry.use_baked_observation])
+
+@persistent
+def frame_change_handler(scene, depsgraph=None):
+    # Antennas can be animated
+    data_links.invalidate_antenna_cache()
+    interferometry = scene.interferometry
+    if interferometry.use_baked_observation:
+        sampling.show_baked_frame(scene, interferometry.get_bake_cache(), scene.frame_current)
 
 def register():
     bpy.utils.register_class(ObservatoryLocation)
@@ -387,6 +913,13 @@ def register():
     bpy.app.handlers.load_post.append(load_handler)
     bpy.app.handlers.depsgraph_update_pre.append(depsgraph_handler_pre)
     bpy.app.handlers.depsgraph_update_post.append(depsgraph_handler_post)
+    bpy.app.handlers.frame_change_post.append(frame_change_handler)
+    bpy.app.handlers.load_post.append(data_links.nodegroup_load_handler)
+    bpy.app.handlers.load_post.append(display.load_handler)
+    bpy.app.handlers.undo_post.append(data_links.nodegroup_undo_handler)
+    bpy.app.handlers.redo_post.append(data_links.nodegroup_undo_handler)
+    bpy.app.handlers.render_pre.append(data_links.flush_nodegroup_handler)
+    bpy.app.handlers.frame_change_pre.append(data_links.flush_nodegroup_handler)
 
 def unregister():
     del bpy.types.Scene.observatory
@@ -405,3 +938,10 @@ def unregister():
     bpy.app.handlers.load_post.remove(load_handler)
     bpy.app.handlers.depsgraph_update_pre.remove(depsgraph_handler_pre)
     bpy.app.handlers.depsgraph_update_post.remove(depsgraph_handler_post)
+    bpy.app.handlers.frame_change_post.remove(frame_change_handler)
+    bpy.app.handlers.load_post.remove(data_links.nodegroup_load_handler)
+    bpy.app.handlers.load_post.remove(display.load_handler)
+    bpy.app.handlers.undo_post.remove(data_links.nodegroup_undo_handler)
+    bpy.app.handlers.redo_post.remove(data_links.nodegroup_undo_handler)
+    bpy.app.handlers.render_pre.remove(data_links.flush_nodegroup_handler)
+    bpy.app.handlers.frame_change_pre.remove(data_links.flush_nodegroup_handler)
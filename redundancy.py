@@ -0,0 +1,74 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Detection of redundant baselines.
+# Regular layouts contain many identical baseline vectors; grouping them allows
+# downstream stages to run once per unique baseline with the group size as weight.
+
+import numpy as np
+
+"""
+Group vectors that coincide within the tolerance, using a sort based unique pass over quantized keys.
+vectors is an (N, D) array, a tolerance of zero only groups exactly equal vectors.
+If fold_conjugate is True, v and -v are grouped together, which is valid wherever mirrored conjugate samples are added.
+Returns the unique vectors (mean of each group), the group index of each vector,
+the number of vectors per group and the sign of each vector relative to its group.
+"""
+def group_redundant(vectors, tolerance, fold_conjugate=False):
+    vectors = np.asarray(vectors, dtype=np.float64)
+    if vectors.ndim != 2:
+        vectors = vectors.reshape(len(vectors), -1)
+    num, dims = vectors.shape
+    if num == 0:
+        return np.zeros((0, dims)), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.ones(0)
+
+    quantized = np.round(vectors / tolerance).astype(np.int64) if tolerance > 0.0 else vectors
+    signs = np.ones(num)
+    if fold_conjugate:
+        # Orient vectors so that the first non-zero quantized component is positive
+        lead = quantized[np.arange(num), np.argmax(quantized != 0, axis=1)]
+        signs[lead < 0] = -1.0
+        quantized = quantized * signs.astype(quantized.dtype)[:, None]
+
+    extent = None
+    if tolerance > 0.0:
+        quantized = quantized - np.min(quantized, axis=0)
+        extent = np.max(quantized, axis=0) + 1
+    if extent is not None and np.prod(extent.astype(np.float64)) < 2.0**62:
+        # Combine quantized coordinates into a single integer key for a fast 1D unique pass
+        keys = np.zeros(num, dtype=np.int64)
+        for k in range(dims):
+            keys = keys * extent[k] + quantized[:, k]
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    else:
+        _, inverse, counts = np.unique(quantized, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    oriented = vectors * signs[:, None]
+    unique = np.stack([np.bincount(inverse, weights=oriented[:, k], minlength=len(counts)) for k in range(dims)], axis=1)
+    unique /= counts[:, None]
+    return unique, inverse, counts, signs
@@ -29,19 +29,34 @@ from math import *
 import numpy as np
 from numpy import fft as fft
 import queue
+from functools import partial
+import threading
+import time
+from .coordinates import earth_rotation_angles, target_rotation_matrices
+from .visibility_store import default_chunk_size
+from . import averaging, beam, catalog, dft, display, export, gridding, mosaic, noise, redundancy, shared_buffers, weighting, workers, wstacking
+import os
+from .constants import c
+from .gridding import antenna_positions, baseline_pairs, compute_baselines, grid_samples, rotate_baselines, sampling_to_images
 
-# Queues for updated image pixel data
-sampling_queue = queue.Queue(maxsize=1)
-pointspread_queue = queue.Queue(maxsize=1)
+# Queues for updated image pixel data, one per scene and image
+update_image_keys = ("sampling", "pointspread", "mosaic")
+_update_queues = {}
 
-icon_size = (16, 16)
-icon_numpixels = icon_size[0] * icon_size[1]
-icon_pixels = [127, 127, 127, 255] * icon_numpixels
-icon_pixels_float = [0.5, 0.5, 0.5, 1.0] * icon_numpixels
+"""
+Pixel update queue of an image of a scene.
+Safe to call from other threads.
+"""
+def get_update_queue(scene_name, image_key):
+    q = _update_queues.get((scene_name, image_key))
+    if q is None:
+        q = _update_queues.setdefault((scene_name, image_key), queue.Queue(maxsize=1))
+    return q
 
 """
 Write pixel data into image data block.
-WARNING: This should only be done on the main thread using the sampling queue!
+Previews are refreshed separately by the display module, only while they are visible.
+WARNING: This should only be done on the main thread using the update queues!
 """
 def update_image_pixels(image, pixels, width, height, allow_resize=False):
     if allow_resize:
@@ -56,14 +71,12 @@ def update_image_pixels(image, pixels, width, height, allow_resize=False):
         assert(image.size[0] == width)
         assert(image.size[1] == height)
 
-    # XXX Workaround for Blender bug: Icon preview job creates a race condition vs. pixel updates:
-    # https://developer.blender.org/T77571
-    image.preview.icon_size = icon_size
-    image.preview.icon_pixels = icon_pixels
-    image.preview.icon_pixels_float = icon_pixels_float
-
-    image.pixels = pixels
-    image.preview.reload()
+    display.begin_pixel_update(image)
+    if isinstance(pixels, np.ndarray):
+        image.pixels.foreach_set(pixels)
+    else:
+        image.pixels = pixels
+    display.end_pixel_update(image)
 
 """
 Create image pixel update job.
@@ -72,22 +85,39 @@ pixels is raw RGBA pixel data that can be written to the image datablock.
 width and height are new image size values, only used if allow_resize is set to True.
 """
 def enqueue_image_pixel_update(q, get_image, pixels, width, height, allow_resize=False):
-    # Clear queue
-    while not q.empty():
-        try:
-            q.get_nowait()
-        except queue.Empty:
-            break
-
     def job(scene):
         image = get_image(scene)
         if image is not None:
             update_image_pixels(image, pixels, width, height, allow_resize)
 
+    put_update_job(q, job)
+
+"""
+Remove pending jobs from an update queue, calling their discard attribute if they have one.
+"""
+def clear_update_queue(q):
+    while not q.empty():
+        try:
+            job = q.get_nowait()
+        except queue.Empty:
+            break
+        discard = getattr(job, "discard", None)
+        if discard is not None:
+            discard()
+
+"""
+Put a job into an update queue, replacing pending jobs.
+Jobs can have a discard attribute, which is called when they are replaced without being executed.
+Safe to call from other threads.
+"""
+def put_update_job(q, job):
+    clear_update_queue(q)
     try:
         q.put_nowait(job)
     except queue.Full:
-        pass
+        discard = getattr(job, "discard", None)
+        if discard is not None:
+            discard()
 
 """
 Check if image pixel update is available and execute it.
@@ -104,8 +134,10 @@ def execute_image_pixel_update(q, scene):
     return False
 
 def execute_all_image_pixel_updates(scene):
-    execute_image_pixel_update(sampling_queue, scene)
-    execute_image_pixel_update(pointspread_queue, scene)
+    for image_key in update_image_keys:
+        q = _update_queues.get((scene.name, image_key))
+        if q is not None:
+            execute_image_pixel_update(q, scene)
 
 """
 Convert data array into image pixels.
@@ -119,57 +151,20 @@ def ndarray_to_pixels(array, mapping=(0.0, 1.0)):
     imgdata = np.dstack((values, values, values, np.ones(values.shape)))
     return imgdata.flatten().tolist()
 
-def compute_sampling_image(scene, antennas):
-    if len(antennas) < 2:
-        return False
-    w = scene.interferometry.image_width
-    h = scene.interferometry.image_height
-    numpixels = w * h
-    if w < 1 or h < 1:
-        return False
-
-    Bmax = 0.0
-    for i, a in enumerate(antennas):
-        for b in antennas[i+1:]:
-            B = (b.xy - a.xy).length
-            if B > Bmax:
-                Bmax = B
-    # bounds_min = antennas[0].xy
-    # bounds_max = antennas[0].xy
-    # for a in antennas[1:]:
-    #     if a.x < bounds_min.x:
-    #         bounds_min.x = a.x
-    #     if a.x > bounds_max.x:
-    #         bounds_max.x = a.x
-    #     if a.y < bounds_min.y:
-    #         bounds_min.y = a.y
-    #     if a.y > bounds_max.y:
-    #         bounds_max.y = a.y
-
-    epsilon = 1.0e-6
-    scale = (min(w, h) / 4) / Bmax
-    invscale = 1.0/scale if scale > epsilon else 1.0
-
-    # Construct sampling from baselines
-    # For real-valued output the input is complex conjugate
-    # and irfft expects only the positive components.
-    sampling = np.zeros((h, w), dtype=np.complex64)
-    num_baselines = len(antennas) * (len(antennas) - 1)
-    for i, a in enumerate(antennas):
-        for b in antennas[i+1:]:
-            B = b.xy - a.xy
-            s = B * scale
-            # Symmetric sampling in the uv space
-            sampling[int(h/2 + 0.5 + s.y), int(w/2 + 0.5 + s.x)] = 1.0
-            sampling[int(h/2 + 0.5 - s.y), int(w/2 + 0.5 - s.x)] = 1.0
-
-    # Compute point spread function
-    fftin = fft.ifftshift(sampling)
-    fftout = fft.ifft2(fftin)
-    pointspread = fft.fftshift(fftout) * numpixels / num_baselines
+"""
+Convert greyscale values into a flat RGBA float array.
+"""
+def grey_to_rgba(values):
+    rgba = np.ones((*values.shape, 4), dtype=np.float32)
+    rgba[..., :3] = values[..., None]
+    return rgba.ravel()
 
+"""
+Enqueue pixel updates for the sampling and point spread images.
+"""
+def enqueue_sampling_images(scene_name, sampling, pointspread):
     enqueue_image_pixel_update(
-        sampling_queue,
+        get_update_queue(scene_name, "sampling"),
         get_image=lambda scene: scene.interferometry.get_sampling_image(create=True),
         pixels=ndarray_to_pixels(sampling),
         width=sampling.shape[1],
@@ -177,7 +172,7 @@ def compute_sampling_image(scene, antennas):
         allow_resize=True,
         )
     enqueue_image_pixel_update(
-        pointspread_queue,
+        get_update_queue(scene_name, "pointspread"),
         get_image=lambda scene: scene.interferometry.get_pointspread_image(create=True),
         pixels=ndarray_to_pixels(pointspread, mapping=(0.0, 1.0)),
         width=pointspread.shape[1],
@@ -185,4 +180,657 @@ def compute_sampling_image(scene, antennas):
         allow_resize=True,
         )
 
-    return True
\ No newline at end of file
+# Latest sampling render per scene that found no free slab, submitted when slabs are released
+_pending_render = {}
+
+def _acquire_render_slabs(scene_name, width, height):
+    slabs = []
+    for image_key in ("sampling", "pointspread"):
+        ring = shared_buffers.get_ring((scene_name, image_key), (height, width))
+        index = ring.acquire()
+        if index is None:
+            for ring, index in slabs:
+                ring.release(index)
+            return None
+        slabs.append((ring, index))
+    return slabs
+
+def _release_render_slabs(slabs):
+    for ring, index in slabs:
+        ring.release(index)
+
+# Error message of the last failed sampling render per scene
+_render_errors = {}
+
+"""
+Return and clear the error message of the last failed sampling render of a scene, or None.
+"""
+def take_render_error(scene_name):
+    return _render_errors.pop(scene_name, None)
+
+def _submit_pending_render(scene_name, scene):
+    pending = _pending_render.pop(scene_name, None)
+    if pending is not None:
+        render_sampling_images(scene, *pending)
+
+def _finish_render(scene_name, slabs, uv_scale, future):
+    if future.cancelled() or future.exception() is not None or not future.result():
+        _release_render_slabs(slabs)
+        # A False result only means that the samples have no weight
+        error = None
+        if future.cancelled():
+            error = "cancelled"
+        elif future.exception() is not None:
+            error = "{}: {}".format(type(future.exception()).__name__, future.exception())
+        if error is not None:
+            _render_errors[scene_name] = error
+            print("Observatory sampling render failed: {}".format(error))
+        # The deferred render still has to be submitted, from the main thread
+        if scene_name in _pending_render:
+            put_update_job(get_update_queue(scene_name, "sampling"), partial(_submit_pending_render, scene_name))
+        return False
+
+    def job(scene):
+        try:
+            (sampling_ring, sampling_index), (pointspread_ring, pointspread_index) = slabs
+            if not sampling_ring.blocks or not pointspread_ring.blocks:
+                # Rings were replaced after an image resize
+                return
+            h, w = sampling_ring.shape
+            sampling_pixels, sampling_raw = sampling_ring.views(sampling_index)
+            pointspread_pixels, pointspread_raw = pointspread_ring.views(pointspread_index)
+            # Pixels are copied straight from shared memory into the images
+            image = scene.interferometry.get_sampling_image(create=True)
+            if image is not None:
+                update_image_pixels(image, sampling_pixels, w, h, allow_resize=True)
+            image = scene.interferometry.get_pointspread_image(create=True)
+            if image is not None:
+                update_image_pixels(image, pointspread_pixels, w, h, allow_resize=True)
+            # Slabs are reused, exported results need their own copy
+            publish_results(scene, uv_scale, sampling=sampling_raw.copy(), pointspread=pointspread_raw.copy())
+            del sampling_pixels, sampling_raw, pointspread_pixels, pointspread_raw
+        finally:
+            _release_render_slabs(slabs)
+            _submit_pending_render(scene_name, scene)
+
+    job.discard = partial(_release_render_slabs, slabs)
+    put_update_job(get_update_queue(scene_name, "sampling"), job)
+    return True
+
+"""
+Render sampling and point spread images in a worker process.
+The worker writes the images into shared memory slabs and only returns a status,
+the update job on the main thread copies pixels directly from the slabs into the images.
+args are the worker arguments (u, v, weights, width, height, scale), uv_scale is the grid scale in pixels per wavelength.
+If wait is False the render runs in the background and the update is queued when it finishes.
+If all slabs are in use the render is deferred until the pending update has been displayed.
+If a renders list is given a finishing function of the submitted render is appended to it instead, see finish_renders.
+"""
+def render_sampling_images(scene, args, uv_scale, wait=False, renders=None):
+    u, v, weights, width, height, scale = args
+    scene_name = scene.name
+    _pending_render.pop(scene_name, None)
+    slabs = _acquire_render_slabs(scene_name, width, height)
+    if slabs is None:
+        if not wait and renders is None:
+            _pending_render[scene_name] = (args, uv_scale)
+            return True
+        # Slabs are still in use by a background render, compute in this process instead
+        sampling = np.zeros((height, width), dtype=np.complex128)
+        grid_samples(sampling, u, v, weights, scale)
+        sampling_image, pointspread = sampling_to_images(sampling)
+        enqueue_sampling_images(scene_name, sampling_image, pointspread)
+        publish_results(scene, uv_scale, sampling=sampling.real, pointspread=np.real(pointspread))
+        return True
+
+    descriptors = [ring.descriptor(index) for ring, index in slabs]
+    future = workers.get_process_pool().submit(gridding.render_sampling_slabs, *args, *descriptors)
+    if renders is not None:
+        renders.append(partial(_finish_render, scene_name, slabs, uv_scale, future))
+        return True
+    if wait:
+        return _finish_render(scene_name, slabs, uv_scale, future)
+    future.add_done_callback(partial(_finish_render, scene_name, slabs, uv_scale))
+    return True
+
+"""
+Wait for renders collected by render_sampling_images and compute_wide_field_image and queue their image updates.
+Returns the number of renders that finished successfully.
+"""
+def finish_renders(renders):
+    return sum(bool(finish()) for finish in renders)
+
+# Raw float results of the last image computation per scene, for export
+last_results = {}
+
+"""
+Keep raw float result arrays of an image computation and export them if auto export is enabled.
+uv_scale is the grid scale in pixels per wavelength, it defines the WCS cell sizes.
+"""
+def publish_results(scene, uv_scale, **arrays):
+    last_results[scene.name] = (uv_scale, arrays)
+    if scene.interferometry.auto_export:
+        export_results(scene)
+
+"""
+Submit the last results of the scene to the background export writer.
+Returns False if there are no results.
+"""
+def export_results(scene):
+    results = last_results.get(scene.name)
+    if results is None:
+        return False
+    uv_scale, arrays = results
+    interferometry = scene.interferometry
+    directory = interferometry.get_export_directory()
+    extension = ".fits" if interferometry.export_format == 'FITS' else ".npy"
+
+    writer = export.get_writer()
+    for name, array in arrays.items():
+        h, w = array.shape
+        if name == 'sampling':
+            cards = export.uv_wcs_cards(w, h, 1.0 / uv_scale, interferometry.frequency)
+        else:
+            cards = export.image_wcs_cards(w, h, interferometry.target.co[:], (uv_scale / w, uv_scale / h), interferometry.frequency)
+        filepath = os.path.join(directory, "{}_{}{}".format(scene.name, name, extension))
+        writer.submit(filepath, array, interferometry.export_format, cards)
+    return True
+
+"""
+Copy baked images of a frame into the sampling and point spread images.
+Returns False if the frame is not baked.
+WARNING: This should only be done on the main thread!
+"""
+def show_baked_frame(scene, cache, frame):
+    interferometry = scene.interferometry
+    for name, get_image in (("sampling", interferometry.get_sampling_image),
+                            ("pointspread", interferometry.get_pointspread_image)):
+        values = cache.frame_pixels(name, frame)
+        if values is None:
+            return False
+        image = get_image(create=True)
+        if image is not None:
+            update_image_pixels(image, grey_to_rgba(values), cache.width, cache.height, allow_resize=True)
+    return True
+
+"""
+Simulate an earth rotation synthesis observation and append the samples to a visibility store.
+The observation starts at the given day and hour and covers the duration in hours with one sample per integration time (seconds).
+Samples are generated in blocks of time steps to keep memory bounded by chunk_size samples.
+If averaging_tolerance is greater than zero, samples are averaged per baseline in time and frequency
+as long as the uv smearing stays below the tolerance in wavelengths.
+sources is an optional sky model (l, m, n - 1, flux) of point sources, see catalog.direction_cosines,
+whose predicted visibilities are stored instead of unit visibilities.
+"""
+def simulate_observation(store, positions, location, target, day, hour, duration, integration_time, frequencies,
+                         chunk_size=default_chunk_size, averaging_tolerance=0.0, sources=None):
+    baselines = compute_baselines(positions)
+    num_baselines = len(baselines)
+    num_channels = len(frequencies)
+    store.reset(frequencies, len(positions))
+    if num_baselines == 0:
+        return
+
+    time_step = integration_time / 3600.0
+    hours = hour + np.arange(0.0, duration, time_step)
+    block_size = max(1, chunk_size // (num_baselines * num_channels))
+    baseline_index = np.arange(num_baselines, dtype=np.int32)
+    if sources is not None:
+        # Visibilities are predicted once per unique baseline and expanded, conjugated for reversed baselines
+        unique_baselines, redundant_index, _, redundant_sign = redundancy.group_redundant(baselines, 0.0, fold_conjugate=True)
+    if averaging_tolerance > 0.0:
+        channel_width = abs(frequencies[1] - frequencies[0]) if num_channels > 1 else 0.0
+        time_window, freq_window = averaging.averaging_windows(baselines, max(frequencies), time_step, channel_width, averaging_tolerance)
+        averager = averaging.SampleAverager(frequencies, time_window, freq_window)
+    for start in range(0, len(hours), block_size):
+        block_hours = hours[start:start + block_size]
+        rotations = target_rotation_matrices(location, target, earth_rotation_angles(day, block_hours))
+        uvw = rotate_baselines(baselines, rotations)
+        vis = None
+        if sources is not None:
+            # Predicted visibilities of the sky model per channel, shape (T, M, C)
+            unique_uvw = rotate_baselines(unique_baselines, rotations)
+            vis = np.stack([catalog.predict_visibilities(*(unique_uvw * (f / c)).transpose(2, 0, 1), *sources)
+                            for f in frequencies], axis=-1)[:, redundant_index]
+            vis[:, redundant_sign < 0] = np.conj(vis[:, redundant_sign < 0])
+        if averaging_tolerance > 0.0:
+            columns = averager.add(uvw, day * 24.0 + block_hours, np.arange(start, start + len(block_hours)), vis=vis)
+            if columns is not None:
+                store.append(**columns)
+            continue
+
+        times = np.broadcast_to((day * 24.0 + block_hours)[:, None], uvw.shape[:2])
+        for channel in range(num_channels):
+            store.append(
+                uvw=uvw.reshape(-1, 3),
+                time=times.reshape(-1),
+                baseline=np.tile(baseline_index, len(block_hours)),
+                channel=channel,
+                vis=1.0 if vis is None else vis[..., channel].reshape(-1),
+                )
+
+    if averaging_tolerance > 0.0:
+        columns = averager.finish()
+        if columns is not None:
+            store.append(**columns)
+
+"""
+Grid scale in pixels per wavelength for the samples of a visibility store, 0 if the store is empty.
+"""
+def store_grid_scale(store, w, h):
+    frequencies = store.channel_frequencies()
+    if len(store) == 0 or len(frequencies) == 0 or store.max_uv <= 0.0:
+        return 0.0
+    max_uv = store.max_uv * np.max(frequencies) / c
+    return (min(w, h) / 4) / max_uv
+
+"""
+Iterate over chunks of a visibility store with uv coordinates in wavelengths and imaging weights.
+Uniform and Briggs weighting need the sample density, which is accumulated in a first pass over the store.
+Yields (chunk, uv, weight) tuples.
+"""
+def iter_weighted_store_chunks(store, w, h, scale, chunk_size=default_chunk_size, names=("uvw", "channel", "weight"),
+                               weighting_mode='NATURAL', robust=0.0, taper=0.0):
+    frequencies = store.channel_frequencies()
+
+    def chunk_uv(chunk):
+        return chunk["uvw"][:, :2] * (frequencies[chunk["channel"]] / c)[:, None]
+
+    density = None
+    if weighting_mode != 'NATURAL':
+        for chunk in store.iter_chunks(chunk_size, names=("uvw", "channel", "weight")):
+            uv = chunk_uv(chunk)
+            density = weighting.accumulate_density(density, uv[:, 0], uv[:, 1], chunk["weight"], w, h, scale)
+
+    names = tuple(set(names) | {"uvw", "channel", "weight"})
+    for chunk in store.iter_chunks(chunk_size, names=names):
+        uv = chunk_uv(chunk)
+        weight = weighting.weight_samples(uv[:, 0], uv[:, 1], chunk["weight"], density, w, h, scale,
+                                          mode=weighting_mode, robust=robust, taper=taper * min(w, h) / 4)
+        yield chunk, uv, weight
+
+"""
+Grid all samples of a visibility store in bounded-memory chunks.
+Returns the complex sampling grid, the gridded visibilities and the grid scale in pixels per wavelength,
+coordinates are converted to wavelengths per channel.
+"""
+def grid_visibility_store(store, w, h, chunk_size=default_chunk_size, weighting_mode='NATURAL', robust=0.0, taper=0.0):
+    sampling = np.zeros((h, w), dtype=np.complex128)
+    visibility = np.zeros((h, w), dtype=np.complex128)
+    scale = store_grid_scale(store, w, h)
+    if scale <= 0.0:
+        return None, None, 0.0
+
+    for chunk, uv, weight in iter_weighted_store_chunks(store, w, h, scale, chunk_size=chunk_size, names=("vis",),
+                                                        weighting_mode=weighting_mode, robust=robust, taper=taper):
+        grid_samples(sampling, uv[:, 0], uv[:, 1], weight, scale)
+        grid_samples(visibility, uv[:, 0], uv[:, 1], weight * chunk["vis"], scale)
+
+    return sampling, visibility, scale
+
+"""
+Compute sampling and point spread images from a visibility store instead of the current antenna snapshot.
+"""
+def compute_store_images(scene, store, chunk_size=default_chunk_size):
+    w = scene.interferometry.image_width
+    h = scene.interferometry.image_height
+    if w < 1 or h < 1:
+        return False
+
+    interferometry = scene.interferometry
+    sampling, visibility, scale = grid_visibility_store(store, w, h, chunk_size=chunk_size,
+                                                        weighting_mode=interferometry.weighting,
+                                                        robust=interferometry.robustness,
+                                                        taper=interferometry.uv_taper)
+    if sampling is None:
+        return False
+
+    sampling_image, pointspread = sampling_to_images(sampling)
+    enqueue_sampling_images(scene.name, sampling_image, pointspread)
+
+    dirty = fft.fftshift(fft.ifft2(fft.ifftshift(visibility))) * (w * h) / np.sum(sampling.real)
+    publish_results(scene, scale, sampling=sampling.real, pointspread=np.real(pointspread), dirty=np.real(dirty))
+
+    return True
+
+"""
+Monte Carlo estimate of the thermal image noise of the samples in a visibility store.
+Visibility noise is derived per baseline and channel from the system temperature (receiver plus sky),
+dish size, channel bandwidth and integration time, samples averaged from n integrations have 1/sqrt(n) of the noise.
+Returns a dictionary of statistics, or None if the store is empty.
+"""
+def compute_noise_statistics(scene, store, chunk_size=default_chunk_size, progress=None):
+    interferometry = scene.interferometry
+    w = interferometry.image_width
+    h = interferometry.image_height
+    scale = store_grid_scale(store, w, h)
+    if w < 1 or h < 1 or scale <= 0.0:
+        return None
+
+    frequencies = store.channel_frequencies()
+    tsys = interferometry.system_temperature + noise.sky_temperature(frequencies)
+    # Per baseline and channel noise, all antennas share the system temperature of their channel
+    sigma = noise.baseline_sigma(np.broadcast_to(tsys, (store.num_antennas, len(frequencies))),
+                                 interferometry.dish_diameter, interferometry.aperture_efficiency,
+                                 interferometry.channel_width, interferometry.integration_time,
+                                 pairs=baseline_pairs(store.num_antennas))
+
+    noise_grid = noise.NoiseGrid(w, h, scale)
+    for chunk, uv, weight in iter_weighted_store_chunks(store, w, h, scale, chunk_size=chunk_size, names=("baseline",),
+                                                        weighting_mode=interferometry.weighting,
+                                                        robust=interferometry.robustness,
+                                                        taper=interferometry.uv_taper):
+        sample_sigma = sigma[chunk["baseline"], chunk["channel"]] / np.sqrt(chunk["weight"])
+        noise_grid.add_samples(uv[:, 0], uv[:, 1], weight, sample_sigma)
+
+    start_time = time.perf_counter()
+    mean, stddev, rms = noise.noise_statistics(noise_grid, interferometry.noise_realizations, progress=progress)
+    duration = time.perf_counter() - start_time
+    publish_results(scene, scale, noise_mean=mean, noise_stddev=stddev)
+
+    return {
+        "realizations": interferometry.noise_realizations,
+        "visibility_sigma": float(np.median(sigma)),
+        "expected": float(noise.expected_image_noise(noise_grid)),
+        "rms": float(rms),
+        "min_stddev": float(np.min(stddev)),
+        "max_stddev": float(np.max(stddev)),
+        "time": duration,
+    }
+
+"""
+Imaging weights of samples with natural weights (e.g. baseline multiplicity), using the weighting settings of the scene.
+"""
+def compute_sample_weights(interferometry, u, v, w, h, scale, weights=1.0):
+    density = None
+    if interferometry.weighting != 'NATURAL':
+        density = weighting.accumulate_density(None, u, v, weights, w, h, scale)
+    return weighting.weight_samples(u, v, weights, density, w, h, scale,
+                                    mode=interferometry.weighting,
+                                    robust=interferometry.robustness,
+                                    taper=interferometry.uv_taper * min(w, h) / 4)
+
+"""
+Unique baselines of the antennas and their multiplicity, redundant baselines are grouped with the tolerance of the scene.
+b and -b are grouped as well, since all imaging adds mirrored conjugate samples.
+"""
+def compute_unique_baselines(interferometry, antennas):
+    baselines = compute_baselines(antenna_positions(antennas))
+    unique, _, counts, _ = redundancy.group_redundant(baselines, interferometry.redundancy_tolerance, fold_conjugate=True)
+    return unique, counts.astype(np.float64)
+
+"""
+Compute sampling and point spread images of the current baselines.
+Flat images are rendered in a worker process, see render_sampling_images.
+unique_baselines are the (baselines, multiplicity) of compute_unique_baselines, computed from the antennas if None.
+"""
+def compute_sampling_image(scene, antennas, wait=False, unique_baselines=None, renders=None):
+    if len(antennas) < 2:
+        return False
+    interferometry = scene.interferometry
+    w = interferometry.image_width
+    h = interferometry.image_height
+    if w < 1 or h < 1:
+        return False
+
+    if unique_baselines is None:
+        unique_baselines = compute_unique_baselines(interferometry, antennas)
+    baselines, multiplicity = unique_baselines
+    if interferometry.imaging_mode == 'WSTACK':
+        return compute_wide_field_image(scene, baselines, multiplicity, wait=wait, renders=renders if wait else None)
+
+    u = baselines[:, 0]
+    v = baselines[:, 1]
+    Bmax = np.max(np.hypot(u, v))
+    if Bmax <= 0.0:
+        return False
+    scale = (min(w, h) / 4) / Bmax
+
+    # Construct sampling from baselines
+    # For real-valued output the input is complex conjugate
+    # and irfft expects only the positive components.
+    # Redundant baselines are gridded once with their multiplicity as weight.
+    weights = compute_sample_weights(interferometry, u, v, w, h, scale, weights=multiplicity)
+
+    # Baselines are in meters, convert the grid scale to pixels per wavelength
+    return render_sampling_images(scene, (u, v, weights, w, h, scale), scale * interferometry.wavelength,
+                                  wait=wait, renders=renders if wait else None)
+
+"""
+Compute sampling and point spread images of several scenes.
+antennas maps scene names to antenna positions, see data_links.find_scene_antennas.
+Baselines are shared between scenes with identical antenna positions and redundancy tolerance,
+images of all scenes are rendered concurrently in the worker pool and delivered through the update queues of each scene.
+Renders are only finished before returning if wait is True.
+Returns the number of scenes with new images.
+"""
+def compute_scene_sampling_images(scenes, antennas, wait=False):
+    shared_baselines = {}
+    renders = []
+    count = 0
+    for scene in scenes:
+        interferometry = scene.interferometry
+        positions = antennas.get(scene.name)
+        if positions is None or len(positions) < 2:
+            continue
+        key = (np.ascontiguousarray(positions).tobytes(), interferometry.redundancy_tolerance)
+        if key not in shared_baselines:
+            shared_baselines[key] = compute_unique_baselines(interferometry, positions)
+        if compute_sampling_image(scene, positions, wait=wait, unique_baselines=shared_baselines[key], renders=renders):
+            count += 1
+    if renders:
+        count -= len(renders) - finish_renders(renders)
+    return count
+
+"""
+Drop update queues, slab rings and deferred renders of scenes that no longer exist, e.g. after renaming or deleting scenes.
+scene_names are the names of all existing scenes.
+"""
+def prune_scene_state(scene_names):
+    keep = set(scene_names)
+    for key in [key for key in _update_queues if key[0] not in keep]:
+        # Release slabs held by jobs that will never run
+        clear_update_queue(_update_queues.pop(key))
+    for scene_name in [name for name in _pending_render if name not in keep]:
+        _pending_render.pop(scene_name, None)
+    for scene_name in [name for name in _render_errors if name not in keep]:
+        _render_errors.pop(scene_name, None)
+    shared_buffers.close_rings(lambda image_id: image_id[0] not in keep)
+
+"""
+Compute sampling and point spread images with w-stacking, using the full uvw coordinates of the baselines
+in the target frame at the current time. Groups of w-planes are imaged in worker processes.
+multiplicity is the number of redundant baselines represented by each baseline.
+If wait is False the images are finished by an update job of the scene once all groups are done.
+If a renders list is given the w-plane groups are only submitted and a finishing function is appended, see finish_renders.
+"""
+def compute_wide_field_image(scene, baselines, multiplicity=1.0, wait=True, renders=None):
+    observatory = scene.observatory
+    interferometry = scene.interferometry
+    w = interferometry.image_width
+    h = interferometry.image_height
+
+    rotation = target_rotation_matrices(observatory.location.co[:], interferometry.target.co[:], observatory.time.earth_rotation)
+    uvw = rotate_baselines(baselines, rotation[None])[0] / interferometry.wavelength
+    u, v, uvw_w = uvw.T
+    max_uv = np.max(np.hypot(u, v))
+    if max_uv <= 0.0:
+        return False
+    scale = (min(w, h) / 4) / max_uv
+
+    weights = compute_sample_weights(interferometry, u, v, w, h, scale, weights=multiplicity)
+    sampling = np.zeros((h, w), dtype=np.complex128)
+    grid_samples(sampling, u, v, weights, scale)
+    total_weight = np.sum(sampling.real)
+    if total_weight <= 0.0:
+        return False
+
+    args, num_planes = wstacking.wstack_plane_groups(u, v, uvw_w, weights, w, h, scale, num_groups=os.cpu_count())
+    executor = workers.get_process_pool()
+    futures = [executor.submit(wstacking.image_planes, *a) for a in args]
+    if renders is not None:
+        renders.append(partial(_finish_wide_field_image, scene, sampling, total_weight, scale, futures))
+        return True
+    if wait:
+        return _finish_wide_field_image(scene, sampling, total_weight, scale, futures)
+    _queue_wide_field_image(scene.name, sampling, total_weight, scale, futures)
+    return True
+
+"""
+Queue the finishing of a wide-field image as an update job once all w-plane groups are done,
+so the main thread never waits for the worker processes.
+"""
+def _queue_wide_field_image(scene_name, sampling, total_weight, scale, futures):
+    lock = threading.Lock()
+    remaining = [len(futures)]
+
+    def job(scene):
+        _finish_wide_field_image(scene, sampling, total_weight, scale, futures, update_now=True)
+
+    def done(future):
+        with lock:
+            remaining[0] -= 1
+            if remaining[0] > 0:
+                return
+        put_update_job(get_update_queue(scene_name, "sampling"), job)
+
+    for future in futures:
+        future.add_done_callback(done)
+
+"""
+Sum the w-plane groups of a wide-field image and deliver the images.
+With update_now the images are written directly, this must be done on the main thread,
+otherwise pixel updates are queued.
+"""
+def _finish_wide_field_image(scene, sampling, total_weight, scale, futures, update_now=False):
+    w, h = sampling.shape[1], sampling.shape[0]
+    try:
+        image = np.sum([f.result() for f in futures], axis=0)
+    except Exception as err:
+        error = "{}: {}".format(type(err).__name__, err)
+        _render_errors[scene.name] = error
+        print("Observatory wide-field render failed: {}".format(error))
+        return False
+    pointspread = image * (w * h) / total_weight
+    sampling_image = sampling.real / np.max(sampling.real)
+
+    if update_now:
+        for image, array in ((scene.interferometry.get_sampling_image(create=True), sampling_image),
+                             (scene.interferometry.get_pointspread_image(create=True), pointspread)):
+            if image is not None:
+                update_image_pixels(image, ndarray_to_pixels(array), w, h, allow_resize=True)
+    else:
+        enqueue_sampling_images(scene.name, sampling_image, pointspread)
+
+    publish_results(scene, scale, sampling=sampling.real, pointspread=np.real(pointspread))
+
+    return True
+
+"""
+Compute a linear mosaic of a grid of pointings around the target for the current baselines.
+Each pointing observes the sky model attenuated by its primary beam, pointings are imaged at their own phase centre
+in worker processes and reprojected onto the image grid of the target, see mosaic.image_pointing.
+sources is a sky model (l, m, n - 1, flux) relative to the target, a unit source at the target is used if None.
+Returns a dictionary of statistics, or None if no image can be computed.
+"""
+def compute_mosaic_image(scene, antennas, sources=None):
+    if len(antennas) < 2:
+        return None
+    observatory = scene.observatory
+    interferometry = scene.interferometry
+    w = interferometry.image_width
+    h = interferometry.image_height
+    if w < 1 or h < 1:
+        return None
+
+    baselines, multiplicity = compute_unique_baselines(interferometry, antennas)
+    rotation = target_rotation_matrices(observatory.location.co[:], interferometry.target.co[:], observatory.time.earth_rotation)
+    uvw = rotate_baselines(baselines, rotation[None])[0] / interferometry.wavelength
+    u, v = uvw[:, 0], uvw[:, 1]
+    max_uv = np.max(np.hypot(u, v))
+    if max_uv <= 0.0:
+        return None
+    scale = (min(w, h) / 4) / max_uv
+    weights = compute_sample_weights(interferometry, u, v, w, h, scale, weights=multiplicity)
+
+    if sources is None:
+        sources = (np.zeros(1), np.zeros(1), np.zeros(1), np.ones(1, dtype=np.float32))
+    l, m, n_minus_1, flux = sources
+    fwhm = beam.beam_fwhm(interferometry.dish_diameter, interferometry.frequency)
+    offsets = mosaic.pointing_offsets(interferometry.mosaic_size, interferometry.mosaic_spacing * fwhm)
+
+    start = time.perf_counter()
+    executor = workers.get_process_pool()
+    futures = []
+    beams = []
+    for l0, m0 in offsets:
+        attenuation = beam.primary_beam(interferometry.beam_model, interferometry.dish_diameter, interferometry.frequency,
+                                        np.hypot(l - l0, m - m0))
+        futures.append(executor.submit(mosaic.image_pointing, u, v, weights, l, m, n_minus_1, flux * attenuation, w, h, scale,
+                                       float(l0), float(m0)))
+        beams.append(beam.beam_image(interferometry.beam_model, interferometry.dish_diameter, interferometry.frequency,
+                                     w, h, scale, float(l0), float(m0)))
+    image, sensitivity = mosaic.linear_mosaic([f.result() for f in futures], beams)
+    duration = time.perf_counter() - start
+
+    peak = np.max(np.abs(image))
+    enqueue_image_pixel_update(
+        get_update_queue(scene.name, "mosaic"),
+        get_image=lambda scene: scene.interferometry.get_mosaic_image(create=True),
+        pixels=ndarray_to_pixels(image / peak if peak > 0.0 else image),
+        width=w,
+        height=h,
+        allow_resize=True,
+        )
+    publish_results(scene, scale, mosaic=image, mosaic_sensitivity=sensitivity)
+
+    return {
+        "num_pointings": len(offsets),
+        "beam_width": fwhm,
+        "peak": float(peak),
+        "time": duration,
+    }
+
+"""
+Validate the gridded point spread function of the current baselines against an exact direct Fourier transform.
+Only a centered window of at most window_size pixels is evaluated.
+Returns a dictionary with the maximum and RMS difference, or None if no image can be computed.
+"""
+def validate_pointspread(scene, antennas, window_size):
+    if len(antennas) < 2:
+        return None
+    interferometry = scene.interferometry
+    w = interferometry.image_width
+    h = interferometry.image_height
+
+    baselines, multiplicity = compute_unique_baselines(interferometry, antennas)
+    u = baselines[:, 0]
+    v = baselines[:, 1]
+    Bmax = np.max(np.hypot(u, v))
+    if Bmax <= 0.0:
+        return None
+    scale = (min(w, h) / 4) / Bmax
+
+    weights = compute_sample_weights(interferometry, u, v, w, h, scale, weights=multiplicity)
+    sampling = np.zeros((h, w), dtype=np.complex128)
+    grid_samples(sampling, u, v, weights, scale)
+    _, pointspread = sampling_to_images(sampling)
+
+    x0 = max(w // 2 - window_size // 2, 0)
+    y0 = max(h // 2 - window_size // 2, 0)
+    x1 = min(x0 + window_size, w)
+    y1 = min(y0 + window_size, h)
+    l, m = dft.window_coordinates(w, h, scale, x0, x1, y0, y1)
+
+    start = time.perf_counter()
+    exact = dft.dft_window(u, v, weights, l, m) / (2.0 * np.sum(weights))
+    duration = time.perf_counter() - start
+
+    max_error, rms_error = dft.compare_images(np.real(pointspread[y0:y1, x0:x1]), exact)
+    return {
+        "max_error": max_error,
+        "rms_error": rms_error,
+        "window": [x1 - x0, y1 - y0],
+        "time": duration,
+    }
+
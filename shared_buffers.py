@@ -0,0 +1,162 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Shared memory transport of image results from worker processes to the main thread.
+# Each image id owns a ring of preallocated float32 slabs in shared memory.
+# Workers write RGBA pixels and raw values into a slab in place and only return small descriptors,
+# the main thread copies pixels straight from the slab into the image datablock.
+
+from collections import OrderedDict
+from multiprocessing import shared_memory
+import threading
+import uuid
+import numpy as np
+
+# Slabs per image: one being written by a worker while the other waits for display
+default_num_slabs = 2
+
+"""
+Slab layout for an image of shape (h, w): RGBA pixels followed by the raw float values.
+"""
+def slab_size(shape):
+    h, w = shape
+    return h * w * 5
+
+def slab_views(buffer, shape):
+    h, w = shape
+    data = np.ndarray((slab_size(shape),), dtype=np.float32, buffer=buffer)
+    return data[:h * w * 4], data[h * w * 4:].reshape(h, w)
+
+"""
+Ring of shared memory slabs for images of a fixed shape.
+Slabs are acquired before submitting work and released after the main thread consumed the result.
+"""
+class SlabRing:
+    def __init__(self, shape, num_slabs=default_num_slabs):
+        self.shape = tuple(shape)
+        nbytes = slab_size(self.shape) * np.dtype(np.float32).itemsize
+        self.blocks = [shared_memory.SharedMemory(name="obs_" + uuid.uuid4().hex[:16], create=True, size=nbytes)
+                       for _ in range(num_slabs)]
+        self._free = list(range(num_slabs))
+        self._lock = threading.Lock()
+
+    """
+    Index of a free slab, or None if all slabs are in use.
+    """
+    def acquire(self):
+        with self._lock:
+            return self._free.pop() if self._free else None
+
+    def release(self, index):
+        with self._lock:
+            if index not in self._free:
+                self._free.append(index)
+
+    """
+    Small picklable description of a slab for worker processes.
+    """
+    def descriptor(self, index):
+        return (self.blocks[index].name, self.shape)
+
+    """
+    RGBA pixel and raw value views of a slab.
+    """
+    def views(self, index):
+        return slab_views(self.blocks[index].buf, self.shape)
+
+    def close(self):
+        for block in self.blocks:
+            try:
+                block.close()
+            except BufferError:
+                # Views of a queued update still reference the block, the mapping is released with them
+                pass
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self.blocks = []
+        self._free = []
+
+_rings = {}
+
+"""
+Slab ring of an image id, replaced when the image shape changes.
+"""
+def get_ring(image_id, shape):
+    ring = _rings.get(image_id)
+    if ring is None or ring.shape != tuple(shape):
+        if ring is not None:
+            ring.close()
+        ring = SlabRing(shape)
+        _rings[image_id] = ring
+    return ring
+
+"""
+Close and remove the rings whose image id matches the predicate.
+"""
+def close_rings(predicate):
+    for image_id in [image_id for image_id in _rings if predicate(image_id)]:
+        _rings.pop(image_id).close()
+
+def shutdown():
+    for ring in _rings.values():
+        ring.close()
+    _rings.clear()
+
+# Worker side: shared memory blocks stay attached between tasks
+_attached = OrderedDict()
+max_attached = 16
+
+def _attach(name):
+    block = _attached.get(name)
+    if block is None:
+        try:
+            # Blocks are owned by the main process, workers must not unlink them on exit
+            block = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            block = shared_memory.SharedMemory(name=name)
+        _attached[name] = block
+        while len(_attached) > max_attached:
+            _attached.popitem(last=False)[1].close()
+    else:
+        _attached.move_to_end(name)
+    return block
+
+"""
+Worker: write a greyscale image into the slab of a descriptor.
+Display pixels are the values divided by norm and clipped to [0, 1], raw values are stored unchanged.
+"""
+def write_grey_slab(descriptor, values, norm=1.0):
+    name, shape = descriptor
+    pixels, raw = slab_views(_attach(name).buf, shape)
+    raw[...] = values
+    rgba = pixels.reshape(*shape, 4)
+    np.clip(raw / norm if norm > 0.0 else raw, 0.0, 1.0, out=rgba[..., 0])
+    rgba[..., 1] = rgba[..., 0]
+    rgba[..., 2] = rgba[..., 0]
+    rgba[..., 3] = 1.0
@@ -0,0 +1,83 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+import numpy as np
+from observatory import averaging
+
+def average(block_size, uvw, times, vis, frequencies, time_window, freq_window):
+    averager = averaging.SampleAverager(frequencies, time_window, freq_window)
+    results = []
+    for a in range(0, len(times), block_size):
+        b = min(a + block_size, len(times))
+        results.append(averager.add(uvw[a:b], times[a:b], np.arange(a, b), vis=vis[a:b]))
+    results.append(averager.finish())
+    results = [r for r in results if r is not None]
+    columns = {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+    # Windows complete in a different order depending on the blocks
+    order = np.lexsort((columns["time"], columns["channel"], columns["baseline"]))
+    return {key: value[order] for key, value in columns.items()}
+
+def test_block_size_invariance():
+    rng = np.random.default_rng(1)
+    num_times, num_baselines, num_channels = 50, 40, 8
+    uvw = rng.normal(size=(num_times, num_baselines, 3)) * 100.0
+    times = np.arange(num_times) * 0.01
+    vis = rng.normal(size=(num_times, num_baselines, num_channels)) + 1j * rng.normal(size=(num_times, num_baselines, num_channels))
+    frequencies = 1.0e9 + np.arange(num_channels) * 1.0e6
+    time_window = rng.integers(1, 20, num_baselines)
+    freq_window = rng.integers(1, 5, num_baselines)
+
+    expected = average(num_times, uvw, times, vis, frequencies, time_window, freq_window)
+    # Every sample ends up in exactly one window
+    assert np.sum(expected["weight"]) == num_times * num_baselines * num_channels
+    num_windows = np.sum(np.ceil(num_times / time_window) * np.ceil(num_channels / freq_window))
+    assert len(expected["weight"]) == num_windows
+
+    for block_size in (1, 3, 17):
+        result = average(block_size, uvw, times, vis, frequencies, time_window, freq_window)
+        for key in expected:
+            np.testing.assert_allclose(result[key], expected[key], rtol=1.0e-12, atol=1.0e-9)
+
+def test_unit_windows_keep_samples():
+    frequencies = np.array([1.0e9, 1.1e9])
+    uvw = np.arange(2 * 3 * 3, dtype=np.float64).reshape(2, 3, 3)
+    averager = averaging.SampleAverager(frequencies, np.ones(3, dtype=np.int64), np.ones(3, dtype=np.int64))
+    columns = averager.add(uvw, np.array([0.0, 1.0]), np.arange(2))
+    assert averager.finish() is None
+    assert len(columns["weight"]) == 2 * 3 * 2
+    assert np.all(columns["weight"] == 1.0)
+    # Each window keeps the uvw of its own sample in meters
+    order = np.lexsort((columns["channel"], columns["time"], columns["baseline"]))
+    np.testing.assert_allclose(columns["uvw"][order], np.repeat(uvw.transpose(1, 0, 2).reshape(-1, 3), 2, axis=0))
+
+def test_averaging_windows_shrink_with_baseline_length():
+    baselines = np.array([[0.0, 0.0, 0.0], [10.0, 0.0, 0.0], [1000.0, 0.0, 0.0]])
+    time_window, freq_window = averaging.averaging_windows(baselines, 1.4e9, 10.0 / 3600.0, 1.0e6, 1.0)
+    assert np.all(time_window >= 1) and np.all(freq_window >= 1)
+    assert time_window[0] >= time_window[1] >= time_window[2]
+    assert freq_window[0] >= freq_window[1] >= freq_window[2]
+    assert time_window[2] < time_window[1]
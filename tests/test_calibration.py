@@ -0,0 +1,90 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+import numpy as np
+from observatory import calibration
+from observatory.gridding import baseline_pairs
+from observatory.visibility_store import VisibilityStore
+
+def observed_matrices(gains, model):
+    observed = gains[:, :, None] * model * np.conj(gains[:, None, :])
+    diagonal = np.arange(gains.shape[1])
+    observed[:, diagonal, diagonal] = 0.0
+    return observed
+
+def test_stefcal_recovers_gains():
+    num_slots, num_antennas = 6, 12
+    gains = calibration.generate_gains(num_antennas, num_slots, 0.1, 0.3, seed=3)
+    observed = observed_matrices(gains, np.ones((num_slots, num_antennas, num_antennas)))
+
+    solved, iterations, converged = calibration.stefcal(observed, max_iterations=200, tolerance=1.0e-10)
+    assert np.all(converged)
+    assert np.all(iterations <= 200)
+    # Gains are only determined up to a common phase
+    np.testing.assert_allclose(calibration.reference_phase(solved), calibration.reference_phase(gains), atol=1.0e-8)
+
+def test_stefcal_with_model():
+    rng = np.random.default_rng(4)
+    num_slots, num_antennas = 3, 10
+    gains = calibration.generate_gains(num_antennas, num_slots, 0.1, 0.3, seed=5)
+    model = rng.normal(size=(num_slots, num_antennas, num_antennas)) + 1j * rng.normal(size=(num_slots, num_antennas, num_antennas))
+    # Model visibilities are Hermitian without autocorrelations
+    model = model + np.conj(np.swapaxes(model, 1, 2))
+    model[:, np.arange(num_antennas), np.arange(num_antennas)] = 0.0
+    observed = observed_matrices(gains, model)
+
+    solved, _, converged = calibration.stefcal(observed, model, max_iterations=500, tolerance=1.0e-10)
+    assert np.all(converged)
+    np.testing.assert_allclose(calibration.reference_phase(solved), calibration.reference_phase(gains), atol=1.0e-7)
+
+def test_calibrate_store(tmp_path):
+    num_antennas, num_times = 8, 40
+    store = VisibilityStore(str(tmp_path))
+    store.reset([1.4e9], num_antennas)
+    pair_p, _ = baseline_pairs(num_antennas)
+    num_baselines = len(pair_p)
+    times = np.repeat(np.linspace(0.0, 1.0, num_times), num_baselines)
+    baseline = np.tile(np.arange(num_baselines), num_times)
+    store.append(np.zeros((len(times), 3)), times, baseline, 0)
+
+    gains = calibration.generate_gains(num_antennas, 4, 0.1, 0.3, seed=6)
+    solved, stats = calibration.calibrate_store(store, gains, max_iterations=200, tolerance=1.0e-10, chunk_size=100)
+    assert stats["num_slots"] == 4
+    assert stats["num_empty_slots"] == 0
+    assert stats["converged"] == 1.0
+    assert stats["rms_error"] < 1.0e-6
+    np.testing.assert_allclose(calibration.reference_phase(solved), calibration.reference_phase(gains), atol=1.0e-6)
+
+def test_calibrate_store_without_samples(tmp_path):
+    store = VisibilityStore(str(tmp_path))
+    store.reset([1.4e9], 4)
+    gains = calibration.generate_gains(4, 2, 0.1, 0.3, seed=7)
+    assert calibration.calibrate_store(store, gains) is None
+
+    # Samples without weight do not constrain any slot
+    store.append(np.zeros((6, 3)), np.linspace(0.0, 1.0, 6), np.arange(6), 0, weight=0.0)
+    assert calibration.calibrate_store(store, gains) is None
@@ -0,0 +1,60 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+import numpy as np
+from observatory import dft
+from observatory.gridding import grid_samples, sampling_to_images
+
+def test_dft_matches_gridded_pointspread():
+    width, height, scale = 64, 48, 0.5
+    rng = np.random.default_rng(2)
+    # Samples on pixel centers are gridded without position errors, so both transforms agree exactly
+    u = rng.integers(-20, 21, 200) / scale
+    v = rng.integers(-15, 16, 200) / scale
+    weights = rng.uniform(0.5, 2.0, 200)
+
+    sampling = np.zeros((height, width), dtype=np.complex128)
+    grid_samples(sampling, u, v, weights, scale)
+    _, pointspread = sampling_to_images(sampling)
+
+    l, m = dft.window_coordinates(width, height, scale, 0, width, 0, height)
+    exact = dft.dft_window(u, v, weights, l, m, chunk_samples=64) / (2.0 * np.sum(weights))
+    max_diff, rms_diff = dft.compare_images(np.real(pointspread), exact)
+    assert max_diff < 1.0e-10
+    assert rms_diff <= max_diff
+
+def test_points_match_window():
+    rng = np.random.default_rng(3)
+    u, v = rng.normal(size=(2, 100)) * 10.0
+    values = rng.normal(size=100) + 1j * rng.normal(size=100)
+    l = np.linspace(-0.05, 0.05, 7)
+    m = np.linspace(-0.04, 0.04, 5)
+
+    window = dft.dft_window(u, v, values, l, m, chunk_samples=32)
+    ll, mm = np.meshgrid(l, m)
+    points = dft.dft_points(u, v, values, ll, mm, chunk_pixels=8, chunk_samples=32)
+    np.testing.assert_allclose(points.reshape(window.shape), window, atol=1.0e-10)
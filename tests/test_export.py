@@ -0,0 +1,86 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+import os
+import numpy as np
+import pytest
+from observatory import export
+
+def read_fits(filepath):
+    with open(filepath, 'rb') as f:
+        raw = f.read()
+    assert len(raw) % export.fits_block_size == 0
+    cards = {}
+    offset = 0
+    while True:
+        card = raw[offset:offset + export.fits_card_size].decode('ascii')
+        offset += export.fits_card_size
+        key = card[:8].strip()
+        if key == "END":
+            break
+        value = card[10:].split(" / ")[0].strip()
+        cards[key] = value.strip("'").strip() if value.startswith("'") else value
+    # Data starts at the next block after the header
+    offset += -offset % export.fits_block_size
+    height, width = int(cards["NAXIS2"]), int(cards["NAXIS1"])
+    data = np.frombuffer(raw, dtype='>f4', count=width * height, offset=offset).reshape(height, width)
+    return cards, data
+
+def test_fits_round_trip(tmp_path):
+    array = np.random.default_rng(0).normal(size=(30, 50))
+    cards = export.image_wcs_cards(50, 30, (np.radians(30.0), np.radians(45.0)), (1.0e-4, 2.0e-4), 1.4e9)
+    filepath = str(tmp_path / "image.fits")
+    export.write_fits(filepath, array, cards)
+
+    header, data = read_fits(filepath)
+    assert header["SIMPLE"] == "T"
+    assert header["BITPIX"] == "-32"
+    assert header["CTYPE1"] == "RA---SIN"
+    assert float(header["CRPIX1"]) == 26.0
+    assert float(header["CRVAL1"]) == 30.0
+    assert float(header["CDELT1"]) == pytest.approx(-np.degrees(1.0e-4), rel=1.0e-14)
+    assert float(header["RESTFRQ"]) == 1.4e9
+    np.testing.assert_array_equal(data, array.astype(np.float32))
+
+def test_writer(tmp_path):
+    writer = export.ExportWriter()
+    array = np.arange(12.0).reshape(3, 4)
+    writer.submit(str(tmp_path / "sub" / "a.npy"), array, 'NPY')
+    writer.submit(str(tmp_path / "sub" / "b.fits"), array, 'FITS', export.uv_wcs_cards(4, 3, 0.5, 1.4e9))
+    # A failed job is reported and does not stop the writer, FITS only supports 2D images
+    writer.submit(str(tmp_path / "sub" / "bad.fits"), array[None], 'FITS')
+    writer.submit(str(tmp_path / "sub" / "c.npy"), array, 'NPY')
+    writer.stop()
+
+    np.testing.assert_array_equal(np.load(str(tmp_path / "sub" / "a.npy")), array)
+    header, data = read_fits(str(tmp_path / "sub" / "b.fits"))
+    assert header["CTYPE1"] == "UU"
+    np.testing.assert_array_equal(data, array)
+    errors = writer.take_errors()
+    assert len(errors) == 1 and errors[0].startswith(str(tmp_path / "sub" / "bad.fits"))
+    assert os.path.exists(str(tmp_path / "sub" / "c.npy"))
+    assert writer.take_errors() == []
@@ -0,0 +1,88 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+import numpy as np
+from observatory import redundancy
+from observatory.gridding import compute_baselines, grid_samples
+
+def regular_layout(size, spacing, jitter=0.0, seed=0):
+    x, y = np.meshgrid(np.arange(size), np.arange(size))
+    positions = np.stack((x.ravel(), y.ravel(), np.zeros(size * size)), axis=1) * spacing
+    return positions + np.random.default_rng(seed).uniform(-jitter, jitter, positions.shape)
+
+def brute_force_groups(vectors, tolerance, fold_conjugate):
+    groups = []
+    for i, vector in enumerate(vectors):
+        for group in groups:
+            reference = vectors[group[0]]
+            if np.max(np.abs(vector - reference)) < tolerance or (fold_conjugate and np.max(np.abs(vector + reference)) < tolerance):
+                group.append(i)
+                break
+        else:
+            groups.append([i])
+    return sorted(tuple(group) for group in groups)
+
+def partition(inverse):
+    groups = {}
+    for i, g in enumerate(inverse):
+        groups.setdefault(g, []).append(i)
+    return sorted(tuple(group) for group in groups.values())
+
+def test_groups_match_brute_force():
+    # Jitter is far below the tolerance, so quantization never splits a group
+    baselines = compute_baselines(regular_layout(5, 10.0, jitter=1.0e-4))
+    for fold_conjugate in (False, True):
+        unique, inverse, counts, signs = redundancy.group_redundant(baselines, 0.01, fold_conjugate=fold_conjugate)
+        assert partition(inverse) == brute_force_groups(baselines, 0.01, fold_conjugate)
+        assert np.sum(counts) == len(baselines)
+        np.testing.assert_array_equal(np.bincount(inverse), counts)
+        np.testing.assert_allclose(baselines * signs[:, None], unique[inverse], atol=1.0e-3)
+
+def test_zero_tolerance_groups_equal_vectors():
+    vectors = np.array([[1.0, 2.0], [1.0, 2.0], [-1.0, -2.0], [1.0, 2.0 + 1.0e-9]])
+    _, inverse, counts, _ = redundancy.group_redundant(vectors, 0.0)
+    assert partition(inverse) == [(0, 1), (2,), (3,)]
+    _, inverse, counts, signs = redundancy.group_redundant(vectors, 0.0, fold_conjugate=True)
+    assert partition(inverse) == [(0, 1, 2), (3,)]
+    assert signs[2] == -signs[0]
+
+def test_empty_input():
+    unique, inverse, counts, signs = redundancy.group_redundant(np.zeros((0, 3)), 0.01)
+    assert unique.shape == (0, 3)
+    assert len(inverse) == len(counts) == len(signs) == 0
+
+def test_multiplicity_weights_match_all_baselines():
+    baselines = compute_baselines(regular_layout(4, 10.0))
+    unique, _, counts, _ = redundancy.group_redundant(baselines, 0.01, fold_conjugate=True)
+    assert len(unique) < len(baselines)
+
+    expected = np.zeros((64, 64), dtype=np.complex128)
+    grid_samples(expected, baselines[:, 0], baselines[:, 1], 1.0, 0.5)
+    # Mirrored samples make conjugate baselines grid identically
+    result = np.zeros((64, 64), dtype=np.complex128)
+    grid_samples(result, unique[:, 0], unique[:, 1], counts.astype(np.float64), 0.5)
+    np.testing.assert_allclose(result, expected)
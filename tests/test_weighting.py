@@ -0,0 +1,83 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+import numpy as np
+import pytest
+from observatory import weighting
+from observatory.gridding import grid_samples
+
+width, height, scale = 64, 64, 1.0
+
+def samples(seed=0):
+    rng = np.random.default_rng(seed)
+    u, v = rng.uniform(-25.0, 25.0, size=(2, 500))
+    return u, v, rng.uniform(0.5, 2.0, 500)
+
+@pytest.mark.parametrize("mode", ['NATURAL', 'UNIFORM', 'BRIGGS'])
+def test_sample_weights_match_grid_weights(mode):
+    u, v, natural = samples()
+    density = weighting.accumulate_density(None, u, v, natural, width, height, scale)
+    weights = weighting.weight_samples(u, v, natural, density, width, height, scale, mode=mode, robust=0.5)
+
+    gridded = np.zeros((height, width), dtype=np.complex128)
+    grid_samples(gridded, u, v, weights, scale)
+    expected = weighting.weight_grid(density.reshape(height, width), mode=mode, robust=0.5)
+    np.testing.assert_allclose(gridded.real, expected, atol=1.0e-12)
+
+def test_density_splits_into_blocks():
+    u, v, natural = samples(1)
+    density = weighting.accumulate_density(None, u, v, natural, width, height, scale)
+    blocks = None
+    for a in range(0, len(u), 128):
+        blocks = weighting.accumulate_density(blocks, u[a:a + 128], v[a:a + 128], natural[a:a + 128], width, height, scale)
+    np.testing.assert_allclose(blocks, density)
+    # Every sample and its mirrored conjugate are counted
+    assert np.sum(density) == pytest.approx(2.0 * np.sum(natural))
+
+def test_briggs_limits():
+    u, v, natural = samples(2)
+    density = weighting.accumulate_density(None, u, v, natural, width, height, scale)
+    args = (u, v, natural, density, width, height, scale)
+    uniform = weighting.weight_samples(*args, mode='UNIFORM')
+    # Very robust weighting approaches natural weights, very negative robustness approaches uniform up to a factor
+    robust = weighting.weight_samples(*args, mode='BRIGGS', robust=4.0)
+    np.testing.assert_allclose(robust, natural, rtol=1.0e-2)
+    strict = weighting.weight_samples(*args, mode='BRIGGS', robust=-4.0)
+    np.testing.assert_allclose(strict / np.sum(strict), uniform / np.sum(uniform), rtol=1.0e-2)
+
+def test_taper_reduces_long_baselines():
+    u = np.array([0.0, 5.0, 20.0])
+    v = np.zeros(3)
+    weights = weighting.weight_samples(u, v, 1.0, None, width, height, scale, taper=10.0)
+    assert weights[0] == 1.0
+    assert weights[0] > weights[1] > weights[2] > 0.0
+
+def test_unknown_mode():
+    u, v, natural = samples()
+    density = weighting.accumulate_density(None, u, v, natural, width, height, scale)
+    with pytest.raises(ValueError):
+        weighting.weight_samples(u, v, natural, density, width, height, scale, mode='SUPER')
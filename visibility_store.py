@@ -0,0 +1,171 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+import json
+import os
+import numpy as np
+
+"""
+Column layout of the visibility store: name, dtype and per-sample shape.
+uvw: baseline coordinates in meters in the target frame
+time: hours since the J2000 epoch
+baseline: index of the antenna pair, see gridding.baseline_pairs
+channel: index into the frequency table of the store
+weight: sample weight
+vis: complex visibility
+"""
+columns = (
+    ("uvw", np.float32, (3,)),
+    ("time", np.float64, ()),
+    ("baseline", np.int32, ()),
+    ("channel", np.int16, ()),
+    ("weight", np.float32, ()),
+    ("vis", np.complex64, ()),
+)
+column_names = [name for name, dtype, shape in columns]
+
+header_filename = "header.json"
+default_chunk_size = 1 << 20
+
+"""
+Column-oriented on-disk store of visibility samples.
+Each column is a flat binary file in the store directory that is only ever appended to,
+reading is done through read-only memory maps so that arbitrarily large stores can be streamed in chunks.
+"""
+class VisibilityStore:
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+        self.count = 0
+        self.num_antennas = 0
+        self.frequencies = []
+        self.max_uv = 0.0
+        self.max_w = 0.0
+        self._read_header()
+
+    def __len__(self):
+        return self.count
+
+    def _header_path(self):
+        return os.path.join(self.dirpath, header_filename)
+
+    def _column_path(self, name):
+        return os.path.join(self.dirpath, name + ".bin")
+
+    def _read_header(self):
+        try:
+            with open(self._header_path(), 'r') as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.count = header.get("count", 0)
+        self.num_antennas = header.get("num_antennas", 0)
+        self.frequencies = header.get("frequencies", [])
+        self.max_uv = header.get("max_uv", 0.0)
+        self.max_w = header.get("max_w", 0.0)
+
+    def _write_header(self):
+        header = {
+            "count": self.count,
+            "num_antennas": self.num_antennas,
+            "frequencies": self.frequencies,
+            "max_uv": self.max_uv,
+            "max_w": self.max_w,
+        }
+        # Write to a temporary file first so an interrupted write never corrupts the sample count
+        tmppath = self._header_path() + ".tmp"
+        with open(tmppath, 'w') as f:
+            json.dump(header, f)
+        os.replace(tmppath, self._header_path())
+
+    """
+    Remove all samples and start a new observation with the given frequency table.
+    """
+    def reset(self, frequencies, num_antennas):
+        os.makedirs(self.dirpath, exist_ok=True)
+        for name in column_names:
+            with open(self._column_path(name), 'wb'):
+                pass
+        self.count = 0
+        self.num_antennas = num_antennas
+        self.frequencies = [float(f) for f in frequencies]
+        self.max_uv = 0.0
+        self.max_w = 0.0
+        self._write_header()
+
+    """
+    Append samples to the store.
+    All arrays must have the same length, scalars are broadcast to the sample count.
+    """
+    def append(self, uvw, time, baseline, channel, weight=1.0, vis=1.0):
+        uvw = np.asarray(uvw, dtype=np.float32).reshape(-1, 3)
+        n = len(uvw)
+        if n == 0:
+            return
+        data = {
+            "uvw": uvw,
+            "time": time,
+            "baseline": baseline,
+            "channel": channel,
+            "weight": weight,
+            "vis": vis,
+        }
+        for name, dtype, shape in columns:
+            values = np.broadcast_to(np.asarray(data[name], dtype=dtype), (n, *shape))
+            with open(self._column_path(name), 'ab') as f:
+                np.ascontiguousarray(values).tofile(f)
+
+        self.count += n
+        self.max_uv = max(self.max_uv, float(np.max(np.hypot(uvw[:, 0], uvw[:, 1]))))
+        self.max_w = max(self.max_w, float(np.max(np.abs(uvw[:, 2]))))
+        self._write_header()
+
+    """
+    Read-only memory map of a column.
+    """
+    def column(self, name):
+        dtype, shape = next((dtype, shape) for n, dtype, shape in columns if n == name)
+        if self.count == 0:
+            return np.zeros((0, *shape), dtype=dtype)
+        return np.memmap(self._column_path(name), dtype=dtype, mode='r', shape=(self.count, *shape))
+
+    """
+    Iterate over the store in chunks of at most chunk_size samples.
+    Yields dicts of column arrays, only the requested columns are read.
+    """
+    def iter_chunks(self, chunk_size=default_chunk_size, names=None):
+        if names is None:
+            names = column_names
+        maps = {name: self.column(name) for name in names}
+        for start in range(0, self.count, chunk_size):
+            stop = min(start + chunk_size, self.count)
+            yield {name: np.array(m[start:stop]) for name, m in maps.items()}
+
+    """
+    Frequencies of the channel indices, as an array.
+    """
+    def channel_frequencies(self):
+        return np.array(self.frequencies, dtype=np.float64)
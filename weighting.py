@@ -0,0 +1,117 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+import numpy as np
+
+weighting_items = [
+    ('NATURAL', "Natural", "Every sample contributes with its own weight, best sensitivity"),
+    ('UNIFORM', "Uniform", "Samples are weighted inversely to the local sampling density, best resolution"),
+    ('BRIGGS', "Briggs", "Robust weighting between uniform and natural"),
+]
+
+"""
+Flat pixel indices of uv samples on a grid of shape (h, w).
+scale converts uv coordinates to pixels, sign selects the sample (1) or its mirrored conjugate (-1).
+Returns the indices and a mask of samples inside the grid.
+"""
+def uv_pixel_indices(u, v, w, h, scale, sign=1.0):
+    x = np.floor(w/2 + 0.5 + sign * scale * np.asarray(u)).astype(np.int64)
+    y = np.floor(h/2 + 0.5 + sign * scale * np.asarray(v)).astype(np.int64)
+    mask = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+    return y * w + x, mask
+
+"""
+Accumulate the weighted sample density on the uv grid, including mirrored samples.
+Density is a flat array of w * h values, a new array is created if None.
+"""
+def accumulate_density(density, u, v, weights, w, h, scale):
+    if density is None:
+        density = np.zeros(w * h, dtype=np.float64)
+    weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), np.shape(u))
+    for sign in (1.0, -1.0):
+        index, mask = uv_pixel_indices(u, v, w, h, scale, sign)
+        density += np.bincount(index[mask], weights=weights[mask], minlength=w * h)
+    return density
+
+"""
+Briggs weighting factor f^2 for the robustness parameter R in [-2, 2].
+"""
+def briggs_factor(density, robust):
+    total = np.sum(density)
+    if total <= 0.0:
+        return 0.0
+    return (5.0 * 10.0**(-robust))**2 / (np.sum(density**2) / total)
+
+"""
+Compute imaging weights for samples.
+density is the flat grid density from accumulate_density, it is only needed for uniform and Briggs weighting.
+taper is the width of a Gaussian uv taper in grid pixels, disabled if zero.
+"""
+def weight_samples(u, v, weights, density, w, h, scale, mode='NATURAL', robust=0.0, taper=0.0):
+    weights = np.broadcast_to(np.asarray(weights, dtype=np.float64), np.shape(u))
+
+    if mode == 'NATURAL':
+        result = weights.copy()
+    else:
+        index, mask = uv_pixel_indices(u, v, w, h, scale)
+        sample_density = np.where(mask, density[np.where(mask, index, 0)], 0.0)
+        if mode == 'UNIFORM':
+            result = np.divide(weights, sample_density, out=np.zeros_like(weights), where=sample_density > 0.0)
+        elif mode == 'BRIGGS':
+            result = weights / (1.0 + sample_density * briggs_factor(density, robust))
+        else:
+            raise ValueError("Unknown weighting mode {}".format(mode))
+
+    if taper > 0.0:
+        r2 = (np.asarray(u) * scale)**2 + (np.asarray(v) * scale)**2
+        result *= np.exp(-0.5 * r2 / (taper * taper))
+
+    return result
+
+"""
+Apply a weighting scheme to a grid of natural sample weights.
+This is equivalent to weighting individual samples when the density is measured on the same grid,
+which allows reweighting accumulated grids without access to the samples.
+"""
+def weight_grid(density, mode='NATURAL', robust=0.0, taper=0.0):
+    if mode == 'NATURAL':
+        result = density.copy()
+    elif mode == 'UNIFORM':
+        result = (density > 0.0).astype(density.dtype)
+    elif mode == 'BRIGGS':
+        result = density / (1.0 + density * briggs_factor(density, robust))
+    else:
+        raise ValueError("Unknown weighting mode {}".format(mode))
+
+    if taper > 0.0:
+        h, w = density.shape
+        x = np.arange(w) - np.floor(w/2 + 0.5)
+        y = np.arange(h) - np.floor(h/2 + 0.5)
+        r2 = x[None, :]**2 + y[:, None]**2
+        result *= np.exp(-0.5 * r2 / (taper * taper))
+
+    return result
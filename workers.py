@@ -0,0 +1,61 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Process pool for heavy computations outside of the Blender main thread.
+# Worker functions must live in modules that do not import bpy or mathutils.
+
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import sys
+
+_executor = None
+
+"""
+Python executable for worker processes.
+Older Blender versions report the Blender binary as sys.executable, the bundled Python has to be used instead.
+"""
+def get_python_executable():
+    import bpy
+    return getattr(bpy.app, "binary_path_python", None) or sys.executable
+
+"""
+Shared process pool, created on first use.
+"""
+def get_process_pool():
+    global _executor
+    if _executor is None:
+        context = multiprocessing.get_context('spawn')
+        context.set_executable(get_python_executable())
+        _executor = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=context)
+    return _executor
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,135 @@
+# ##### BEGIN MIT LICENSE BLOCK #####
+#
+# Copyright (c) 2020 Lukas Toenne
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+# ##### END MIT LICENSE BLOCK #####
+
+
+# <pep8 compliant>
+
+# Wide-field imaging with w-stacking.
+# Samples are binned into planes of constant w, each plane is gridded and transformed separately
+# and the w-dependent phase screen is applied in the image plane before accumulating.
+
+import numpy as np
+from numpy import fft as fft
+from .gridding import grid_samples
+
+imaging_mode_items = [
+    ('FLAT', "Flat", "Assume a coplanar array and a narrow field of view, only u and v are used"),
+    ('WSTACK', "W-Stacking", "Wide-field imaging using the full uvw coordinates"),
+]
+
+# Maximum phase error in radians caused by the distance of a sample to its w-plane
+default_phase_tolerance = 0.5
+default_max_planes = 256
+
+"""
+Direction cosines (l, m) and n - 1 of the image pixels.
+scale is the uv grid scale in pixels per wavelength, which determines the field of view.
+"""
+def image_coordinates(width, height, scale):
+    l = (np.arange(width) - width // 2) * scale / width
+    m = (np.arange(height) - height // 2) * scale / height
+    l, m = np.meshgrid(l, m)
+    r2 = l * l + m * m
+    # Pixels beyond the horizon have no physical meaning, they get n = 0
+    n_minus_1 = np.sqrt(np.maximum(1.0 - r2, 0.0)) - 1.0
+    return l, m, n_minus_1
+
+"""
+Number of w-planes needed for the given maximum |w| and field of view.
+Planes are spaced so that the phase error at the edge of the field stays below the tolerance.
+"""
+def choose_num_planes(max_w, n_minus_1, phase_tolerance=default_phase_tolerance, max_planes=default_max_planes):
+    max_n = float(np.max(np.abs(n_minus_1)))
+    if max_w <= 0.0 or max_n <= 0.0:
+        return 1
+    # Half the plane spacing is the largest w distance of a sample to its plane
+    spacing = phase_tolerance / (np.pi * max_n)
+    return int(np.clip(np.ceil(2.0 * max_w / spacing) + 1, 1, max_planes))
+
+"""
+Worker: grid, transform and phase correct a set of w-planes, returns the accumulated complex image.
+Samples must be sorted by plane, plane_bounds gives the sample range of each plane.
+"""
+def image_planes(u, v, values, plane_w, plane_bounds, width, height, scale):
+    _, _, n_minus_1 = image_coordinates(width, height, scale)
+    image = np.zeros((height, width), dtype=np.complex128)
+    grid = np.empty((height, width), dtype=np.complex128)
+    for wk, (a, b) in zip(plane_w, plane_bounds):
+        if a == b:
+            continue
+        grid[:] = 0.0
+        grid_samples(grid, u[a:b], v[a:b], values[a:b], scale, mirror=False)
+        plane = fft.fftshift(fft.ifft2(fft.ifftshift(grid)))
+        image += plane * np.exp(2j * np.pi * wk * n_minus_1)
+    return image
+
+"""
+Split samples with full uvw coordinates in wavelengths into at most num_groups contiguous groups of w-planes.
+values are the weighted visibilities of the samples, mirrored samples (-u, -v, -w) are added internally.
+Returns the image_planes arguments of each group and the number of w-planes used,
+the wide-field image is the sum of the images of all groups.
+"""
+def wstack_plane_groups(u, v, w, values, width, height, scale, num_groups=1,
+                        phase_tolerance=default_phase_tolerance, max_planes=default_max_planes):
+    values = np.broadcast_to(np.asarray(values, dtype=np.complex128), np.shape(u))
+    u = np.concatenate((u, -u))
+    v = np.concatenate((v, -v))
+    w = np.concatenate((w, -w))
+    values = np.concatenate((values, np.conj(values)))
+
+    _, _, n_minus_1 = image_coordinates(width, height, scale)
+    max_w = float(np.max(np.abs(w))) if len(w) > 0 else 0.0
+    num_planes = choose_num_planes(max_w, n_minus_1, phase_tolerance, max_planes)
+    plane_w = np.linspace(-max_w, max_w, num_planes)
+    if num_planes > 1:
+        plane_index = np.rint((w + max_w) / (plane_w[1] - plane_w[0])).astype(np.int64)
+    else:
+        plane_index = np.zeros(len(w), dtype=np.int64)
+
+    order = np.argsort(plane_index, kind='stable')
+    u, v, values, plane_index = u[order], v[order], values[order], plane_index[order]
+    starts = np.searchsorted(plane_index, np.arange(num_planes + 1))
+    plane_bounds = np.stack((starts[:-1], starts[1:]), axis=1)
+
+    # Split planes into contiguous groups, each worker only gets the samples of its own planes
+    groups = np.array_split(np.arange(num_planes), max(1, min(num_groups, num_planes)))
+    args = []
+    for group in groups:
+        a, b = plane_bounds[group[0], 0], plane_bounds[group[-1], 1]
+        args.append((u[a:b], v[a:b], values[a:b], plane_w[group], plane_bounds[group] - a, width, height, scale))
+    return args, num_planes
+
+"""
+Compute a wide-field image from samples with full uvw coordinates in wavelengths, see wstack_plane_groups.
+If an executor is given, groups of w-planes are imaged in parallel, otherwise all planes are imaged in this process.
+Returns the complex image and the number of w-planes used.
+"""
+def wstack_image(u, v, w, values, width, height, scale, executor=None, num_workers=1,
+                 phase_tolerance=default_phase_tolerance, max_planes=default_max_planes):
+    args, num_planes = wstack_plane_groups(u, v, w, values, width, height, scale, num_workers, phase_tolerance, max_planes)
+    if executor is None:
+        images = [image_planes(*a) for a in args]
+    else:
+        images = [f.result() for f in [executor.submit(image_planes, *a) for a in args]]
+    return np.sum(images, axis=0), num_planes